@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the CPU time notify spends per recipient when sending one
+notification to many recipients, with the network replaced by canned
+responses.
+
+Run from the top of the source tree:
+
+    $ python -m benchmarks.fanout --recipients 10000
+
+"""
+
+import argparse
+import logging
+
+import pushnotify
+from benchmarks import per_message
+
+
+def time_fanout(type_, recipients, runs):
+    """Send one notification to recipients users through a client of
+    type_, runs times.
+
+    Returns:
+        A float containing the fewest CPU seconds taken per recipient.
+
+    """
+
+    client = pushnotify.get_client(type_, 'x' * 30, 'benchmark')
+    client._browser = per_message.CannedSession(
+        per_message.PUSHOVER_RESPONSE if type_ == 'pushover' else
+        per_message.PROWL_RESPONSE)
+    for i in range(recipients):
+        client.add_key('{0:040d}'.format(i))
+
+    timings = []
+    for i in range(runs):
+        start = per_message.cpu_time()
+        client.notify('benchmark message', 'event',
+                      kwargs={'priority': 1, 'url': 'http://example.com/'})
+        timings.append((per_message.cpu_time() - start) / recipients)
+
+    return min(timings)
+
+
+def main():
+    """Print the microseconds per recipient for each client.
+
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipients', type=int, default=10000,
+                        help='recipients per notification (default: 10000)')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='notifications per client (default: 3)')
+    parser.add_argument('--types', default=','.join(
+                        pushnotify.CLIENT_MODULES),
+                        help='comma-separated client types')
+    args = parser.parse_args()
+
+    logging.getLogger('pushnotify').addHandler(logging.NullHandler())
+
+    print('{0:<10} {1:>14}'.format('client', 'us/recipient'))
+
+    for type_ in args.types.split(','):
+        print('{0:<10} {1:>14.1f}'.format(
+            type_, 1e6 * time_fanout(type_, args.recipients, args.runs)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure how long it takes to import pushnotify in a fresh
+interpreter, as short-lived scripts do.
+
+Run from the top of the source tree:
+
+    $ python -m benchmarks.import_time [runs]
+
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+
+STATEMENTS = [
+    ('baseline', 'pass'),
+    ('import pushnotify', 'import pushnotify'),
+    ('from pushnotify import exceptions',
+     'from pushnotify import exceptions'),
+    ('get_client(\'pushover\')',
+     'import pushnotify; pushnotify.get_client(\'pushover\', \'token\')'),
+]
+
+
+def time_statement(statement, runs):
+    """Run statement in runs fresh interpreters.
+
+    Returns:
+        A sorted list of floats containing the seconds each run took.
+
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    timings = []
+
+    for i in range(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', statement], cwd=root)
+        timings.append(time.time() - start)
+
+    return sorted(timings)
+
+
+def main():
+    """Print the median and best time for each statement.
+
+    """
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    print('{0:<36} {1:>10} {2:>10}'.format('statement', 'median ms',
+                                           'best ms'))
+
+    for name, statement in STATEMENTS:
+        timings = time_statement(statement, runs)
+        print('{0:<36} {1:>10.1f} {2:>10.1f}'.format(
+            name, 1000 * timings[len(timings) // 2], 1000 * timings[0]))
+
+
+if __name__ == '__main__':
+    main()
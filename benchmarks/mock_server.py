@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A local stand-in for the Notify My Android, Prowl and Pushover
+servers, for benchmarking and testing the clients offline.
+
+Each provider is served under its own path prefix, such as
+http://127.0.0.1:8000/prowl/add. Use point_at to send a client's
+requests to the mock server instead of the real one.
+
+"""
+
+import BaseHTTPServer
+import json
+import random
+import SocketServer
+import threading
+import time
+import urlparse
+
+
+XML_SUCCESS = {
+    'nma': ('<?xml version="1.0" encoding="UTF-8"?><nma><success '
+            'code="200" remaining="999" resettimer="60" /></nma>'),
+    'prowl': ('<?xml version="1.0" encoding="UTF-8"?><prowl><success '
+              'code="200" remaining="999" resetdate="{reset}" /></prowl>'),
+}
+XML_ERROR = ('<?xml version="1.0" encoding="UTF-8"?><{type_}><error '
+             'code="{code}">{message}</error></{type_}>')
+
+SOUNDS = {'pushover': 'Pushover (default)', 'bike': 'Bike',
+          'classical': 'Classical', 'none': 'None (silent)'}
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers requests in the dialect of the provider named by the
+    first part of the path.
+
+    Keys starting with '_' are treated as invalid.
+
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def _params(self):
+
+        url = urlparse.urlparse(self.path)
+        params = urlparse.parse_qs(url.query)
+
+        length = int(self.headers.getheader('content-length', 0))
+        if length:
+            params.update(urlparse.parse_qs(self.rfile.read(length)))
+
+        return url.path.strip('/').split('/'), dict(
+            (key, values[0]) for key, values in params.items())
+
+    def _reply(self, code, body, content_type):
+
+        # write the whole response at once, so that keep-alive
+        # connections aren't held up by delayed acknowledgements
+
+        self.wfile.write(
+            '{0} {1} {2}\r\nContent-Type: {3}\r\nContent-Length: {4}\r\n'
+            '\r\n{5}'.format(self.protocol_version, code,
+                             self.responses[code][0], content_type,
+                             len(body), body))
+
+    def _reply_pushover(self, action, params):
+
+        if self.server.fail():
+            return self._reply(500, json.dumps(
+                {'status': 0, 'errors': ['internal error']}),
+                'application/json')
+
+        if action == 'sounds.json':
+            return self._reply(200, json.dumps({'status': 1,
+                                                'sounds': SOUNDS}),
+                               'application/json')
+
+        if params.get('user', '').startswith('_'):
+            return self._reply(400, json.dumps(
+                {'status': 0, 'user': 'invalid',
+                 'errors': ['user identifier is invalid']}),
+                'application/json')
+
+        response = {'status': 1, 'request': 'mock'}
+        if action == 'messages.json' and params.get('priority') == '2':
+            response['receipt'] = 'r{0}'.format(self.server.next_id())
+
+        self._reply(200, json.dumps(response), 'application/json')
+
+    def _reply_xml(self, type_, params):
+
+        if self.server.fail():
+            body = XML_ERROR.format(type_=type_, code=500,
+                                    message='Internal error')
+        elif any(key.startswith('_')
+                 for key in params.get('apikey', '').split(',')):
+            body = XML_ERROR.format(type_=type_, code=401,
+                                    message='Invalid API key')
+        else:
+            body = XML_SUCCESS[type_].format(reset=int(time.time()) + 3600)
+
+        self._reply(200, body, 'text/xml')
+
+    def handle(self):
+
+        try:
+            BaseHTTPServer.BaseHTTPRequestHandler.handle(self)
+        except (IOError, AttributeError):
+            # the client went away, or the interpreter is shutting down
+
+            pass
+
+    def do_GET(self):
+
+        self.do_POST()
+
+    def do_POST(self):
+
+        parts, params = self._params()
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if parts[0] == 'pushover':
+            self._reply_pushover(parts[-1], params)
+        elif parts[0] in XML_SUCCESS:
+            self._reply_xml(parts[0], params)
+        else:
+            self._reply(404, 'not found', 'text/plain')
+
+    def log_message(self, format, *args):
+
+        pass
+
+
+class MockServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """A threaded HTTP server speaking each provider's dialect.
+
+    Member Vars:
+        latency: A float containing the number of seconds to wait before
+            answering each request.
+        error_rate: A float between 0 and 1 containing the fraction of
+            requests to answer with a server error.
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0,
+                 error_rate=0.0):
+
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), Handler)
+
+        self.latency = latency
+        self.error_rate = error_rate
+
+        self._ids = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self._thread = None
+
+    @property
+    def url(self):
+        """A string containing the server's base URL.
+
+        """
+
+        return 'http://{0}:{1}'.format(*self.server_address)
+
+    def fail(self):
+        """Decide whether to answer a request with a server error.
+
+        """
+
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def next_id(self):
+
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    def start(self):
+        """Serve requests in a background thread.
+
+        """
+
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving requests.
+
+        """
+
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+
+def point_at(client, base_url):
+    """Send client's requests to the mock server at base_url.
+
+    Args:
+        client: An nma.Client, prowl.Client or pushover.Client.
+        base_url: A string containing the mock server's base URL.
+
+    """
+
+    module = __import__(client.__module__, fromlist=['PUBLIC_API_URL'])
+    prefix = '/'.join([base_url, client._type])
+
+    client._urls = dict(
+        (name, url.replace(module.PUBLIC_API_URL, prefix))
+        for name, url in client._urls.items())
+
+
+def main():
+    """Serve until interrupted, on the port given as the first argument.
+
+    """
+
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    error_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+
+    server = MockServer(port=port, latency=latency, error_rate=error_rate)
+    print('serving on {0}'.format(server.url))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the CPU time each client spends parsing a response.
+
+Run from the top of the source tree:
+
+    $ python -m benchmarks.parse --responses 20000
+
+"""
+
+import argparse
+import json
+import logging
+
+import requests
+
+import pushnotify
+from benchmarks import per_message
+from pushnotify import pushover
+
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>'
+
+# (client type, name, body, Content-Type header, the arguments the
+# client passes to _parse_response after the response)
+
+RESPONSES = [
+    ('nma', 'success', XML_HEADER + '<nma><success code="200" '
+     'remaining="799" resettimer="46" /></nma>', 'text/xml', ()),
+    ('prowl', 'success', per_message.PROWL_RESPONSE, 'text/xml', ()),
+    ('prowl', 'no charset', per_message.PROWL_RESPONSE, 'application/xml',
+     ()),
+    ('prowl', 'error', XML_HEADER + '<prowl><error code="401">Invalid '
+     'API key</error></prowl>', 'text/xml', (True,)),
+    ('prowl', 'retrieve', XML_HEADER + '<prowl><success code="200" '
+     'remaining="999" resetdate="1234567890" /><retrieve token="' +
+     'x' * 40 + '" url="https://www.prowlapp.com/retrieve.php?token=' +
+     'x' * 40 + '" /></prowl>', 'text/xml', ()),
+    ('pushover', 'notify', per_message.PUSHOVER_RESPONSE,
+     'application/json; charset=utf-8', (False, ('receipt',))),
+    ('pushover', 'invalid', json.dumps({
+        'status': 0, 'user': 'invalid', 'request': 'x' * 36,
+        'errors': ['user identifier is invalid']}),
+     'application/json; charset=utf-8', (True, ())),
+    ('pushover', 'sounds', json.dumps({
+        'status': 1, 'request': 'x' * 36,
+        'sounds': dict(('sound{0}'.format(i), 'Sound {0}'.format(i))
+                       for i in range(22))}),
+     'application/json; charset=utf-8', (True, ('sounds',))),
+]
+
+
+def make_response(body, content_type):
+    """Make a requests.Response as requests would for body.
+
+    """
+
+    response = requests.models.Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = content_type
+    response._content = body.encode('utf-8')
+    response.encoding = requests.utils.get_encoding_from_headers(
+        response.headers)
+
+    return response
+
+
+def time_parse(type_, body, content_type, args, responses, runs):
+    """Parse body with a client of type_ responses times, runs times.
+
+    Returns:
+        A float containing the fewest CPU seconds taken per response.
+
+    """
+
+    client = pushnotify.get_client(type_, 'x' * 30, 'benchmark')
+    timings = []
+
+    for i in range(runs):
+        stream = [make_response(body, content_type)
+                  for j in range(responses)]
+
+        start = per_message.cpu_time()
+        for response in stream:
+            client._parse_response(response, *args)
+        timings.append((per_message.cpu_time() - start) / responses)
+
+    return min(timings)
+
+
+def main():
+    """Print the microseconds per response for each response.
+
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--responses', type=int, default=20000,
+                        help='responses per run (default: 20000)')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='runs per response (default: 5)')
+    args = parser.parse_args()
+
+    logging.getLogger('pushnotify').addHandler(logging.NullHandler())
+
+    print('Pushover responses decoded with {0}.loads\n'.format(
+        pushover.json_loads.__module__))
+    print('{0:<10} {1:<10} {2:>14}'.format('client', 'response',
+                                           'us/response'))
+
+    for type_, name, body, content_type, parse_args in RESPONSES:
+        print('{0:<10} {1:<10} {2:>14.1f}'.format(
+            type_, name,
+            1e6 * time_parse(type_, body, content_type, parse_args,
+                             args.responses, args.runs)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the CPU time notify spends on each message, with the network
+replaced by canned responses, at several logging settings.
+
+Run from the top of the source tree:
+
+    $ python -m benchmarks.per_message --messages 20000
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+from requests import models
+
+import pushnotify
+
+try:
+    cpu_time = time.process_time
+except AttributeError:
+    cpu_time = time.clock
+
+
+PROWL_RESPONSE = ('<?xml version="1.0" encoding="UTF-8"?><prowl>'
+                  '<success code="200" remaining="999" '
+                  'resetdate="1234567890" resettimer="60" /></prowl>')
+
+PUSHOVER_RESPONSE = json.dumps({'status': 1, 'request': 'x' * 36})
+
+# (name, level of the pushnotify logger, redact_logs)
+
+SETTINGS = [
+    ('logging disabled', logging.WARNING, False),
+    ('DEBUG', logging.DEBUG, False),
+    ('DEBUG, redacted', logging.DEBUG, True),
+]
+
+
+class CannedResponse(object):
+    """A stand-in for requests.Response.
+
+    """
+
+    def __init__(self, text):
+
+        self.text = text
+        self.content = text.encode('utf-8')
+        self.status_code = 200
+        self.headers = {}
+
+    def json(self):
+
+        return json.loads(self.text)
+
+
+class CannedSession(object):
+    """A stand-in for requests.Session that answers every request with
+    the same response, after encoding the request data as requests
+    would.
+
+    """
+
+    def __init__(self, text):
+
+        self.response = CannedResponse(text)
+
+    def get(self, url, params=None, headers=None, timeout=None):
+
+        models.RequestEncodingMixin._encode_params(params)
+
+        return self.response
+
+    def post(self, url, data=None, headers=None, timeout=None):
+
+        models.RequestEncodingMixin._encode_params(data)
+
+        return self.response
+
+
+def time_notify(type_, messages, redact_logs):
+    """Send messages notifications through a client of type_.
+
+    Returns:
+        A float containing the CPU seconds taken per message.
+
+    """
+
+    client = pushnotify.get_client(type_, 'x' * 30, 'benchmark',
+                                   redact_logs=redact_logs)
+    client._browser = CannedSession(
+        PUSHOVER_RESPONSE if type_ == 'pushover' else PROWL_RESPONSE)
+    client.add_key('k' * 40)
+
+    start = cpu_time()
+    for i in range(messages):
+        client.notify('benchmark message', 'event')
+
+    return (cpu_time() - start) / messages
+
+
+def main():
+    """Print the microseconds per message for each client and setting.
+
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000,
+                        help='notifications per run (default: 20000)')
+    parser.add_argument('--types', default=','.join(
+                        pushnotify.CLIENT_MODULES),
+                        help='comma-separated client types')
+    args = parser.parse_args()
+
+    # log to a file, rather than a NullHandler, so that enabled messages
+    # are formatted and written as they would be in production
+
+    devnull = open(os.devnull, 'w')
+    logger = logging.getLogger('pushnotify')
+    logger.addHandler(logging.StreamHandler(devnull))
+    logger.propagate = False
+
+    print('{0:<10} {1:<30} {2:>12}'.format('client', 'logging',
+                                           'us/message'))
+
+    for type_ in args.types.split(','):
+        for name, level, redact_logs in SETTINGS:
+            logger.setLevel(level)
+            per_message = time_notify(type_, args.messages, redact_logs)
+            print('{0:<10} {1:<30} {2:>12.1f}'.format(
+                type_, name, 1e6 * per_message))
+
+    devnull.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure how many recipients per second a ProcessPoolSender sends to
+with different numbers of worker processes, with the network replaced
+by a requests adapter that answers with canned responses.
+
+Run from the top of the source tree:
+
+    $ python -m benchmarks.processes --recipients 20000
+
+"""
+
+import argparse
+import logging
+import multiprocessing
+import time
+
+import requests
+from requests import adapters
+
+import pushnotify
+from pushnotify import processes
+from benchmarks import per_message
+
+
+class CannedAdapter(adapters.BaseAdapter):
+    """A requests adapter that answers every request with the same
+    Pushover response, so that the rest of requests still runs.
+
+    """
+
+    def send(self, request, **kwargs):
+
+        response = requests.Response()
+        response.status_code = 200
+        response._content = per_message.PUSHOVER_RESPONSE.encode('utf-8')
+        response.request = request
+        response.url = request.url
+
+        return response
+
+    def close(self):
+
+        pass
+
+
+def time_in_process(recipients, workers):
+    """Send to recipients users with a single client.
+
+    Returns:
+        A float containing the recipients sent to per second.
+
+    """
+
+    client = pushnotify.get_client('pushover', 'x' * 30, 'benchmark',
+                                   workers=workers, adapter=CannedAdapter())
+    client.apikeys = dict(('{0:030d}'.format(i), [])
+                          for i in range(recipients))
+
+    start = time.time()
+    client.notify('benchmark message', 'event', report=True)
+
+    return recipients / (time.time() - start)
+
+
+def time_processes(recipients, workers, count, shard_size):
+    """Send to recipients users with a ProcessPoolSender of count
+    processes.
+
+    Returns:
+        A float containing the recipients sent to per second.
+
+    """
+
+    sender = processes.ProcessPoolSender(
+        'pushover', 'x' * 30, 'benchmark', processes=count,
+        shard_size=shard_size, workers=workers, adapter=CannedAdapter())
+
+    try:
+        start = time.time()
+        sender.notify(dict(('{0:030d}'.format(i), [])
+                           for i in range(recipients)),
+                      'benchmark message', 'event')
+        return recipients / (time.time() - start)
+    finally:
+        sender.close()
+
+
+def main():
+    """Print the recipients per second for a single client and for
+    each number of processes.
+
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipients', type=int, default=20000,
+                        help='recipients per notification (default: 20000)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='threads per client (default: 1)')
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='most worker processes (default: CPU count)')
+    parser.add_argument('--shard-size', type=int, default=1000,
+                        help='recipients per shard (default: 1000)')
+    args = parser.parse_args()
+
+    logging.getLogger('pushnotify').addHandler(logging.NullHandler())
+
+    print('{0:<16} {1:>14}'.format('sender', 'recipients/s'))
+    print('{0:<16} {1:>14.0f}'.format(
+        'in process', time_in_process(args.recipients, args.workers)))
+
+    for count in range(1, args.processes + 1):
+        print('{0:<16} {1:>14.0f}'.format(
+            '{0} process{1}'.format(count, '' if count == 1 else 'es'),
+            time_processes(args.recipients, args.workers, count,
+                           args.shard_size)))
+
+
+if __name__ == '__main__':
+    main()
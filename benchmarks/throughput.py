@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the clients' throughput and latency against the local mock
+server, without touching the real notification servers.
+
+Run from the top of the source tree:
+
+    $ python -m benchmarks.throughput --messages 500 --latency 0.005
+
+"""
+
+import argparse
+import logging
+import resource
+import time
+from multiprocessing.pool import ThreadPool
+
+import pushnotify
+from benchmarks import mock_server
+
+
+SCENARIOS = {
+    'notify': lambda client: client.notify('benchmark message', 'event'),
+    'notify_split': lambda client: client.notify('word ' * 4000, 'event'),
+    'verify_user': lambda client: client.verify_user('user'),
+}
+
+
+def percentile(timings, fraction):
+    """Get the value at the given fraction of the sorted timings.
+
+    """
+
+    return timings[min(len(timings) - 1, int(fraction * len(timings)))]
+
+
+class RemoteServer(object):
+    """A mock server running in another process.
+
+    """
+
+    def __init__(self, url):
+
+        self.url = url.rstrip('/')
+
+    def stop(self):
+
+        pass
+
+
+def make_client(type_, server, keys=1, **kwargs):
+    """Make a client of type_ that sends to server, with keys users.
+
+    """
+
+    client = pushnotify.get_client(type_, 'token', 'benchmark', **kwargs)
+    mock_server.point_at(client, server.url)
+
+    for i in range(keys):
+        client.add_key('user{0}'.format(i))
+
+    return client
+
+
+def run(client, scenario, messages, concurrency):
+    """Run a scenario messages times on client.
+
+    Returns:
+        A dictionary of results.
+
+    """
+
+    func = SCENARIOS[scenario]
+
+    def timed(i):
+        start = time.time()
+        try:
+            func(client)
+        except pushnotify.exceptions.PushNotifyError:
+            ok = False
+        else:
+            ok = True
+        return time.time() - start, ok
+
+    pool = ThreadPool(concurrency)
+    try:
+        start = time.time()
+        results = pool.map(timed, range(messages))
+        elapsed = time.time() - start
+    finally:
+        pool.close()
+        pool.join()
+
+    timings = sorted(timing for timing, ok in results)
+
+    return {'rate': messages / elapsed,
+            'p50': percentile(timings, 0.5),
+            'p99': percentile(timings, 0.99),
+            'errors': sum(1 for timing, ok in results if not ok),
+            'maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def main():
+    """Run every scenario for every client and print a table.
+
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200,
+                        help='calls per scenario (default: 200)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='calls in flight at once (default: 1)')
+    parser.add_argument('--keys', type=int, default=1,
+                        help='users per client (default: 1)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='workers per client (default: 1)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='mock server latency in seconds (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of server errors (default: 0)')
+    parser.add_argument('--server',
+                        help='base URL of a mock server started with '
+                        '"python -m benchmarks.mock_server", so that it '
+                        'doesn\'t share this process (default: start one '
+                        'in this process)')
+    parser.add_argument('--types', default=','.join(
+                        pushnotify.CLIENT_MODULES),
+                        help='comma-separated client types')
+    parser.add_argument('--scenarios', default=','.join(sorted(SCENARIOS)),
+                        help='comma-separated scenarios')
+    args = parser.parse_args()
+
+    logging.getLogger('pushnotify').addHandler(logging.NullHandler())
+
+    if args.server:
+        server = RemoteServer(args.server)
+    else:
+        server = mock_server.MockServer(latency=args.latency,
+                                        error_rate=args.error_rate)
+        server.start()
+
+    print('{0:<10} {1:<14} {2:>10} {3:>9} {4:>9} {5:>7} {6:>11}'.format(
+        'client', 'scenario', 'calls/s', 'p50 ms', 'p99 ms', 'errors',
+        'maxrss KiB'))
+
+    try:
+        for type_ in args.types.split(','):
+            client = make_client(type_, server, args.keys,
+                                 workers=args.workers)
+            for scenario in args.scenarios.split(','):
+                result = run(client, scenario, args.messages,
+                             args.concurrency)
+                print('{0:<10} {1:<14} {2:>10.1f} {3:>9.2f} {4:>9.2f} '
+                      '{5:>7} {6:>11}'.format(
+                          type_, scenario, result['rate'],
+                          1000 * result['p50'], 1000 * result['p99'],
+                          result['errors'], result['maxrss']))
+            client._browser.close()
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
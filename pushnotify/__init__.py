@@ -18,18 +18,33 @@
 # You should have received a copy of the GNU General Public License
 # along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
 
+"""Package for sending push notifications to Android and iOS devices.
+
+The provider modules, and the requests library they depend on, are
+only imported when they are first used, either through get_client or
+as attributes of this package.
+
+"""
+
+import importlib
 import logging
+import sys
+import types
 
 from _version import __version__
-import nma
-import prowl
-import pushover
+
+
+CLIENT_MODULES = ('nma', 'prowl', 'pushover')
+SUBMODULES = CLIENT_MODULES + ('abstract', 'aggregate', 'cache',
+                               'exceptions', 'metrics', 'multi', 'outbox',
+                               'processes', 'ratelimit', 'receipts',
+                               'retry')
 
 
 logger = logging.getLogger(__package__)
 
 
-def get_client(type_, developerkey='', application=''):
+def get_client(type_, developerkey='', application='', **kwargs):
     """Get a pushnotify client of the specified type.
 
     Args:
@@ -40,6 +55,9 @@ def get_client(type_, developerkey='', application=''):
             given type_ of client.
         application: A string containing the name of the application on
             behalf of whom the client will be sending messages.
+        kwargs: Any other keyword arguments accepted by the client,
+            such as workers, session, pool_maxsize or timeout. See
+            abstract.AbstractClient for details.
 
     Returns:
         An nma.Client, prowl.Client, or pushover.Client.
@@ -48,12 +66,33 @@ def get_client(type_, developerkey='', application=''):
 
     type_ = type_.lower()
 
-    if type_ == 'nma':
-        return nma.Client(developerkey, application)
-    elif type_ == 'prowl':
-        return prowl.Client(developerkey, application)
-    elif type_ == 'pushover':
-        return pushover.Client(developerkey, application)
+    if type_ in CLIENT_MODULES:
+        module = importlib.import_module('.' + type_, __name__)
+        return module.Client(developerkey, application, **kwargs)
+
+
+class _Package(types.ModuleType):
+    """This package's module object, which imports submodules the first
+    time they are looked up as attributes.
+
+    """
+
+    def __getattr__(self, name):
+
+        if name in SUBMODULES:
+            return importlib.import_module('.' + name, self.__name__)
+
+        raise AttributeError("'module' object has no attribute '{0}'".format(
+            name))
+
+
+# replace this module with a _Package, keeping a reference to the
+# original so that its globals, used by get_client, aren't cleared
+
+_package = _Package(__name__)
+_package.__dict__.update(globals())
+_package._module = sys.modules[__name__]
+sys.modules[__name__] = _package
 
 
 if __name__ == '__main__':
@@ -22,8 +22,364 @@
 
 """
 
+import collections
+import hashlib
+import json
 import logging
+import re
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
 import requests
+from requests import adapters
+from requests import models
+
+from pushnotify import exceptions
+
+
+SECRET_FIELDS = ('apikey', 'developerkey', 'device', 'providerkey', 'token',
+                 'user')
+
+SECRET_PATTERN = re.compile(
+    r'''(\b(?:{0})['"]?\s*[=:]\s*u?['"]?)([^'"&\s]*)'''.format(
+        '|'.join(SECRET_FIELDS)))
+
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+HOOK_EVENTS = ('error', 'notify', 'rate_limit', 'request_end',
+               'request_start', 'retry')
+
+# the errors a delivery report records rather than raises
+
+DELIVERY_ERRORS = (exceptions.PushNotifyError,
+                   requests.exceptions.RequestException)
+
+WHITESPACE = (' ', '\n', '\t')
+
+
+def _chunk_offsets(description, limit, words):
+
+    start = 0
+    length = len(description)
+    utf8 = isinstance(description, bytes)
+
+    while start < length:
+        end = start + limit
+
+        if end >= length:
+            yield start, length
+            return
+
+        brk = -1
+        if words:
+            brk = max(description.rfind(char, start, end)
+                      for char in WHITESPACE)
+
+        if brk > start:
+            end = brk + 1
+        elif utf8:
+            # don't cut a UTF-8 sequence in half
+
+            while end > start and ord(description[end]) & 0xC0 == 0x80:
+                end -= 1
+            if end == start:
+                end = start + limit
+
+        yield start, end
+        start = end
+
+
+def split_description(description, limit, words=True, markers=False):
+    """Split a description into chunks of at most limit characters.
+
+    The chunks are made one at a time, as they are asked for, by
+    slicing the description between offsets, so splitting takes time
+    proportional to its length. Joining the chunks gives back the
+    description, except for any markers.
+
+    Args:
+        description: A string to split. Byte strings are assumed to be
+            UTF-8, and are never split in the middle of a character.
+        limit: An integer containing the most characters in a chunk,
+            such as a client module's DESC_LIMIT.
+        words: A boolean indicating whether to split after the last
+            whitespace in a chunk (True), if there is one, or exactly at
+            the limit (False). (default: True)
+        markers: A boolean indicating whether to end each chunk with a
+            part marker such as " (1/3)", if there is more than one
+            chunk. Room for it is left within limit. (default: False)
+
+    Raises:
+        ValueError: if limit leaves no room for any of the description
+            in a chunk.
+
+    Returns:
+        A generator of strings.
+
+    """
+
+    if limit < 1:
+        raise ValueError('limit must be at least 1: {0}'.format(limit))
+
+    if not markers or len(description) <= limit:
+        for start, end in _chunk_offsets(description, limit, words):
+            yield description[start:end]
+        return
+
+    # the markers take up more room when the number of chunks has more
+    # digits, so try again until the number of digits stays the same
+
+    total = 1
+    while True:
+        room = limit - len(' ({0}/{0})'.format(total))
+        if room < 1:
+            raise ValueError('limit {0} leaves no room for the description '
+                             'after the part markers'.format(limit))
+        offsets = list(_chunk_offsets(description, room, words))
+        if len(str(len(offsets))) <= len(str(total)):
+            break
+        total = len(offsets)
+
+    for number, (start, end) in enumerate(offsets, 1):
+        marker = ' ({0}/{1})'.format(number, len(offsets))
+        yield description[start:end] + marker
+
+
+class FormTemplate(object):
+    """A form-encoded request body whose fixed fields are encoded once,
+    so that each request only encodes the fields that vary.
+
+    Fields are encoded exactly as requests encodes a dictionary of data.
+
+    """
+
+    def __init__(self, fields):
+        """Initialize the template.
+
+        Args:
+            fields: A dictionary of the fields sent in every request.
+                Fields whose value is None are left out.
+
+        """
+
+        self._keys = frozenset(fields)
+        self._body = models.RequestEncodingMixin._encode_params(fields)
+
+    def render(self, **fields):
+        """Get the body of a request.
+
+        Args:
+            fields: The fields that vary from request to request. Any
+                that are also fixed fields are ignored.
+
+        Returns:
+            A string.
+
+        """
+
+        for key in self._keys.intersection(fields):
+            del fields[key]
+
+        body = models.RequestEncodingMixin._encode_params(fields)
+
+        if not self._body or not body:
+            return self._body or body
+
+        return self._body + '&' + body
+
+
+def expand_apikeys(apikeys):
+    """Get every user and device to send a notification to.
+
+    Args:
+        apikeys: A dictionary in the same form as a client's apikeys,
+            where the keys are strings containing API keys, and the
+            values are lists of device keys, which may be empty.
+
+    Returns:
+        A list of (apikey, device_key) tuples, where device_key is ''
+        for API keys without any device keys.
+
+    """
+
+    deliveries = []
+    for apikey, device_keys in apikeys.items():
+        if not device_keys:
+            deliveries.append((apikey, ''))
+        else:
+            for device_key in device_keys:
+                deliveries.append((apikey, device_key))
+
+    return deliveries
+
+
+def make_session(pool_connections=adapters.DEFAULT_POOLSIZE,
+                 pool_maxsize=adapters.DEFAULT_POOLSIZE, adapter=None):
+    """Make a requests.Session that one or more clients can share, so
+    that they reuse each other's open connections.
+
+    Args:
+        pool_connections: An integer containing the number of hosts to
+            keep connection pools for.
+            (default: requests.adapters.DEFAULT_POOLSIZE)
+        pool_maxsize: An integer containing the maximum number of
+            connections to keep open to each host.
+            (default: requests.adapters.DEFAULT_POOLSIZE)
+        adapter: A requests.adapters.BaseAdapter to mount for all http
+            and https URLs instead of an HTTPAdapter built from
+            pool_connections and pool_maxsize. (default: None)
+
+    Returns:
+        A requests.Session.
+
+    """
+
+    if adapter is None:
+        adapter = adapters.HTTPAdapter(pool_connections=pool_connections,
+                                       pool_maxsize=pool_maxsize)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+def map_threads(func, items, workers):
+    """Call func on each item in items, using up to workers threads, and
+    return a list of the results in the same order.
+
+    If func raises an exception, the remaining items are skipped and the
+    exception is raised once the running calls finish.
+
+    """
+
+    items = list(items)
+
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    # plain threads, rather than a multiprocessing ThreadPool, whose
+    # helper threads take up to a tenth of a second to shut down
+
+    results = [None] * len(items)
+    errors = []
+    indexes = iter(range(len(items)))
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            with lock:
+                index = next(indexes, None)
+            if index is None or errors:
+                return
+
+            try:
+                results[index] = func(items[index])
+            except Exception as exc:
+                errors.append(exc)
+                return
+
+    threads = [threading.Thread(target=work)
+               for i in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return results
+
+
+def to_unicode(value):
+    """Get value as unicode, such as to store in sqlite3, which won't
+    store byte strings as TEXT, or to format into other text. Byte
+    strings are assumed to be UTF-8, as the clients assume.
+
+    """
+
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+
+    return value
+
+
+class Response(collections.Mapping):
+    """A read-only record of a single response from a notification
+    server. Look its fields up by key, as with a dictionary.
+
+    Each client's _parse_response method returns a new Response, so
+    threads sharing a client never see each other's results.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+
+        self._fields = dict(*args, **kwargs)
+
+    def __getitem__(self, key):
+
+        return self._fields[key]
+
+    def __iter__(self):
+
+        return iter(self._fields)
+
+    def __len__(self):
+
+        return len(self._fields)
+
+    def __repr__(self):
+
+        return '{0}({1!r})'.format(self.__class__.__name__, self._fields)
+
+
+def _mask(value):
+
+    # keep the end of long values, so that keys can still be told apart
+    # in the logs; short ones, such as 'invalid', aren't secrets
+
+    if len(value) < 16:
+        return value
+
+    return '...' + value[-4:]
+
+
+class Redacted(object):
+    """A request's data or a server's response, wrapped for logging so
+    that the keys and tokens in it are masked. The masking is only done
+    if the message is actually logged.
+
+    """
+
+    def __init__(self, value):
+
+        self.value = value
+
+    def __str__(self):
+
+        if isinstance(self.value, dict):
+            masked = dict(self.value)
+
+            # Prowl and NMA take several API keys separated by commas
+
+            for key in SECRET_FIELDS:
+                if hasattr(masked.get(key), 'split'):
+                    masked[key] = ','.join(
+                        _mask(part) for part in masked[key].split(','))
+
+            return str(masked)
+
+        return SECRET_PATTERN.sub(
+            lambda match: match.group(1) + _mask(match.group(2)),
+            str(self.value))
 
 
 class AbstractClient(object):
@@ -38,10 +394,35 @@ class AbstractClient(object):
         apikeys: A dictionary where the keys are strings containing
             valid user API keys, and the values are lists of strings,
             each containing a valid user device key.
+        workers: An integer containing the maximum number of requests
+            the client will send concurrently.
+        timeout: A float containing the number of seconds to wait for
+            the notification server, or a (connect, read) tuple of
+            them, or None to wait forever.
+        rate_limiter: A pushnotify.ratelimit.RateLimiter that paces
+            requests to stay within the notification server's rate
+            limit, or None to send them as fast as possible.
+        retry_policy: A pushnotify.retry.RetryPolicy used to retry each
+            delivery that fails for a temporary reason, or None to not
+            retry.
+        split_markers: A boolean indicating whether notify ends each
+            part of a split description with a marker such as " (1/3)".
+        verify_cache: A pushnotify.cache.VerifyCache holding the results
+            of verify_user and verify_device, or None to not cache them.
+        dedup_cache: A pushnotify.cache.DedupCache or
+            pushnotify.cache.SQLiteDedupCache remembering recently sent
+            notifications, so that notify skips recipients who were
+            just sent the same one, or None to send every notification.
+        redact_logs: A boolean indicating whether to mask the keys and
+            tokens in logged requests and responses.
 
     """
 
-    def __init__(self, developerkey='', application=''):
+    def __init__(self, developerkey='', application='', workers=1,
+                 session=None, pool_connections=adapters.DEFAULT_POOLSIZE,
+                 pool_maxsize=None, adapter=None, timeout=None,
+                 rate_limiter=None, retry_policy=None, split_markers=False,
+                 verify_cache=None, dedup_cache=None, redact_logs=False):
         """Initialize the client.
 
         Args:
@@ -49,6 +430,44 @@ class AbstractClient(object):
                 the client's application.
             application: A string containing the name of the application
                 on behalf of whom the client will be sending messages.
+            workers: An integer containing the maximum number of
+                requests to send concurrently. (default: 1)
+            session: A requests.Session to send requests with, such as
+                one from make_session shared with other clients. If
+                None, the client makes its own. (default: None)
+            pool_connections: An integer containing the number of hosts
+                to keep connection pools for. Not used if session is
+                set. (default: requests.adapters.DEFAULT_POOLSIZE)
+            pool_maxsize: An integer containing the maximum number of
+                connections to keep open to each host. Not used if
+                session is set. If None, the larger of workers and
+                requests.adapters.DEFAULT_POOLSIZE. (default: None)
+            adapter: A requests.adapters.BaseAdapter to mount for all
+                http and https URLs. If session is set, it is mounted
+                on that session. (default: None)
+            timeout: A float containing the number of seconds to wait
+                for the notification server, or a (connect, read) tuple
+                of them, or None to wait forever. (default: None)
+            rate_limiter: A pushnotify.ratelimit.RateLimiter to pace
+                requests with, which may be shared with other clients
+                using the same keys. Only the Notify My Android and
+                Prowl clients report limits to it. (default: None)
+            retry_policy: A pushnotify.retry.RetryPolicy used to retry
+                each delivery that fails for a temporary reason, such as
+                a server or connection error. (default: None)
+            split_markers: A boolean indicating whether notify ends each
+                part of a split description with a marker such as
+                " (1/3)". (default: False)
+            verify_cache: A pushnotify.cache.VerifyCache to keep the
+                results of verify_user and verify_device in, which may
+                be shared with other clients. (default: None)
+            dedup_cache: A pushnotify.cache.DedupCache or
+                pushnotify.cache.SQLiteDedupCache to remember sent
+                notifications in, which may be shared with other
+                clients. (default: None)
+            redact_logs: A boolean indicating whether to mask the keys
+                and tokens in logged requests and responses.
+                (default: False)
 
         """
 
@@ -61,23 +480,443 @@ class AbstractClient(object):
         self.developerkey = developerkey
         self.application = application
         self.apikeys = {}
+        self.workers = workers
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.split_markers = split_markers
+        self.verify_cache = verify_cache
+        self.dedup_cache = dedup_cache
+        self.redact_logs = redact_logs
+
+        if session is None:
+            if pool_maxsize is None:
+                pool_maxsize = max(workers, adapters.DEFAULT_POOLSIZE)
+            session = make_session(pool_connections, pool_maxsize, adapter)
+        elif adapter is not None:
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
 
-        self._browser = requests.Session()
-        self._last = {}
+        self._browser = session
+        self._hooks = {}
+        self._local = threading.local()
         self._urls = {'notify': '', 'verify': ''}
 
-    def _get(self, url, data):
+    @property
+    def _last(self):
+        """The last Response parsed in the calling thread, kept for
+        backwards compatibility. New code should use the Response
+        returned by _parse_response instead.
+
+        """
+
+        return getattr(self._local, 'last', None) or Response()
+
+    @_last.setter
+    def _last(self, response):
+
+        self._local.last = response
+
+    def _dedup(self, recipients, description, event, kwargs):
+        """Split recipients into those who weren't sent this
+        notification within the dedup cache's window, and the results
+        of sending it to those who were.
+
+        Returns:
+            A two-item tuple where the first item is a list of the
+            recipients to send to, and the second item is a list of the
+            earlier results.
+
+        """
+
+        if self.dedup_cache is None:
+            return list(recipients), []
+
+        fresh = []
+        earlier = []
+
+        for recipient in recipients:
+            key = self._dedup_key(recipient, description, event, kwargs)
+            result = self.dedup_cache.get(key)
+            if result is None:
+                fresh.append(recipient)
+            else:
+                earlier.append(result)
+
+        if earlier:
+            self.logger.info('skipped %d recipients already sent this '
+                             'notification', len(earlier))
+
+        return fresh, earlier
+
+    def _dedup_add(self, sent, description, event, kwargs):
+        """Remember that this notification was sent to each recipient in
+        sent, a list of (recipient, result) tuples.
+
+        """
+
+        if self.dedup_cache is None or not sent:
+            return
+
+        self.dedup_cache.add_many(
+            [(self._dedup_key(recipient, description, event, kwargs), result)
+             for recipient, result in sent])
+
+    def _dedup_key(self, recipient, description, event, kwargs):
+
+        digest = hashlib.sha1(json.dumps(
+            [description, event, kwargs],
+            sort_keys=True).encode('utf-8')).hexdigest()
+
+        return (self._type, self.developerkey, recipient, digest)
+
+    def _delivery(self, user, device, chunk, start, status, response=None,
+                  error=None):
+        """Make the delivery report entry for one chunk of a
+        notification sent to one user or device.
+
+        """
+
+        if error is not None:
+            code = error.args[1] if len(error.args) > 1 else None
+        else:
+            code = int(response['code'])
+
+        return Response(user=user, device=device, chunk=chunk,
+                        status=bool(status) and error is None, code=code,
+                        receipt=(response or {}).get('receipt'),
+                        latency=time.time() - start, error=error)
+
+    def _emit(self, event, **info):
+        """Call each hook added for event with a dictionary of info,
+        plus the event and the client's provider.
+
+        """
+
+        hooks = self._hooks.get(event)
+        if not hooks:
+            return
+
+        info['event'] = event
+        info['provider'] = self._type
+
+        for hook in hooks:
+            try:
+                hook(info)
+            except Exception:
+                self.logger.exception('%s hook failed', event)
+
+    def _get(self, url, data, headers=None):
+
+        self.logger.debug('_get requesting url: %s', url)
+
+        return self._send('GET', url, data, headers)
+
+    def _loggable(self, value):
+        """Get value as it should be passed to the logger.
+
+        """
+
+        if self.redact_logs:
+            return Redacted(value)
+
+        return value
+
+    def _map(self, func, items):
+        """Call func on each item in items, using up to self.workers
+        threads. See map_threads.
+
+        """
+
+        return map_threads(func, items, self.workers)
+
+    def _notify_batches(self, description, event, split, kwargs, report,
+                        fields, desc_limit, key_limit):
+        """Send a notification to the API keys in self.apikeys, key_limit
+        keys to a request, as the Notify My Android and Prowl clients
+        do. fields are the form fields sent with every request, other
+        than the keys, description and kwargs. See their notify methods.
+
+        """
+
+        def send_notify(apikey, description):
+            data = template.render(apikey=apikey, description=description)
+
+            response = self._post(self._urls['notify'], data)
+            return self._parse_response(response)
+
+        def send_batch(batch, first=0):
+            apikey = ','.join(batch)
+            failed = None
+            records = []
+
+            for chunk in range(first, len(desc_list)):
+                start = time.time()
+                response = error = None
+
+                try:
+                    response = self._retry(send_notify, apikey,
+                                           desc_list[chunk])
+                except DELIVERY_ERRORS as exc:
+                    self.logger.warning('notify failed for %d of %d keys: %r',
+                                        len(batch), nkeys, exc)
+                    failed = error = exc
+
+                invalid = isinstance(error, exceptions.ApiKeyError)
+
+                if report and invalid and len(batch) > 1:
+                    # find out which keys are invalid by sending to each
+                    # on its own
+
+                    for key in batch:
+                        records.extend(send_batch([key], chunk)[1])
+                    break
+
+                if report:
+                    records.extend(self._delivery(key, None, chunk, start,
+                                                  True, response, error)
+                                   for key in batch)
+
+                # the rest of the chunks would fail the same way for an
+                # invalid key
+
+                if error is not None and (invalid or not report):
+                    break
+
+            return failed, records
+
+        if not self.apikeys:
+            self.logger.warn('notify called with no users set')
+            return
+
+        desc_list = self._split(description, desc_limit, split)
+
+        apikeys = self._dedup(self.apikeys, description, event, kwargs)[0]
+        if not apikeys:
+            return [] if report else True
+
+        self._emit('notify', recipients=len(apikeys), chunks=len(desc_list))
+
+        nkeys = len(apikeys)
+        batches = [apikeys[i:i + key_limit]
+                   for i in range(0, nkeys, key_limit)]
+
+        # only the keys and description vary between requests, so
+        # encode the rest of the form once
+
+        fields = dict(fields)
+        if kwargs:
+            fields.update(kwargs)
+        template = FormTemplate(fields)
+
+        results = self._map(send_batch, batches)
+
+        if report:
+            records = [record for failed, these in results
+                       for record in these]
+            failed = set(record['user'] for record in records
+                         if not record['status'])
+            self._dedup_add([(key, True) for key in apikeys
+                             if key not in failed],
+                            description, event, kwargs)
+            return records
 
-        self.logger.debug('_get requesting url: {0}'.format(url))
+        errors = [failed for failed, records in results]
 
-        return self._browser.get(url, params=data)
+        self._dedup_add([(key, True) for batch, error in zip(batches, errors)
+                         if error is None for key in batch],
+                        description, event, kwargs)
+
+        # see notify
+
+        failed = [error for error in errors if error is not None]
+        if failed:
+            raise failed[0]
+
+        return True
 
     def _post(self, url, data):
 
-        self.logger.debug('_post sending data: {0}'.format(data))
-        self.logger.debug('_post sending to url: {0}'.format(url))
+        self.logger.debug('_post sending data: %s', self._loggable(data))
+        self.logger.debug('_post sending to url: %s', url)
+
+        return self._send('POST', url, data)
+
+    def _raise_error(self, response):
+        """Raise the exception for an error response, reporting it to
+        the error hooks first.
+
+        """
+
+        try:
+            self._raise_exception(response)
+        except exceptions.PushNotifyError as exc:
+            self._emit('error', error=exc)
+            raise
+
+    def _request(self, method, url, data, headers):
+
+        if method == 'GET':
+            return self._browser.get(url, params=data, headers=headers,
+                                     timeout=self.timeout)
+
+        # bodies from a FormTemplate are already encoded
+
+        if isinstance(data, (bytes, str)):
+            headers = FORM_HEADERS
+
+        return self._browser.post(url, data=data, headers=headers,
+                                  timeout=self.timeout)
+
+    def _retry(self, func, *args):
+        """Call func with args, retrying it according to
+        self.retry_policy.
+
+        """
+
+        if self.retry_policy is None:
+            return func(*args)
+
+        if not self._hooks.get('retry'):
+            return self.retry_policy.call(func, *args)
+
+        attempts = []
+
+        def attempt(*args):
+            if attempts:
+                self._emit('retry', attempt=len(attempts) + 1,
+                           error=attempts[-1])
+
+            try:
+                return func(*args)
+            except Exception as exc:
+                attempts.append(exc)
+                raise
+
+        return self.retry_policy.call(attempt, *args)
+
+    def _send(self, method, url, data, headers=None):
+        """Send a request, reporting it to the request_start and
+        request_end hooks.
+
+        """
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+        if not (self._hooks.get('request_start') or
+                self._hooks.get('request_end')):
+            return self._request(method, url, data, headers)
+
+        size = len(models.RequestEncodingMixin._encode_params(data or {}))
+        self._emit('request_start', method=method, url=url, bytes=size)
+
+        start = time.time()
+        try:
+            response = self._request(method, url, data, headers)
+        except Exception as exc:
+            self._emit('request_end', method=method, url=url, bytes=size,
+                       latency=time.time() - start, status_code=None,
+                       error=exc)
+            raise
+
+        self._emit('request_end', method=method, url=url, bytes=size,
+                   latency=time.time() - start,
+                   status_code=response.status_code, error=None)
+
+        return response
+
+    def _split(self, description, limit, split):
+        """Get the list of descriptions notify should send.
+
+        """
+
+        if not split:
+            return [description]
+
+        return list(split_description(description, limit,
+                                      markers=self.split_markers))
+
+    def _unparseable(self, stream):
+        """Raise the exception for a response whose body couldn't be
+        parsed, reporting it to the error hooks first: ServerError for a
+        5xx status code, such as a proxy's HTML error page, and
+        otherwise UnrecognizedResponseError, which delivery reports
+        record like any other failed delivery.
+
+        """
+
+        msg = 'HTTP {0} with an unrecognized body'.format(stream.status_code)
+
+        if stream.status_code >= 500:
+            error = exceptions.ServerError(msg, stream.status_code)
+        else:
+            error = exceptions.UnrecognizedResponseError(msg,
+                                                         stream.status_code)
+        self._emit('error', error=error)
+
+        raise error
+
+    def _verify_cached(self, verify, apikey, device_key=None):
+        """Return the cached result of verifying apikey and device_key,
+        if there is one, or else call verify and cache its result.
+
+        """
+
+        if self.verify_cache is None:
+            return verify()
+
+        key = (self._type, self.developerkey, apikey, device_key)
+
+        result = self.verify_cache.get(key)
+        if result is None:
+            result = verify()
+            self.verify_cache.set_result(key, result)
 
-        return self._browser.post(url, data=data)
+        return result
+
+    def add_hook(self, event, hook):
+        """Call hook whenever event happens.
+
+        hook is called with a dictionary holding 'event', 'provider'
+        (the client's type, such as 'prowl') and the following, by
+        event:
+
+            request_start: 'method', 'url' and 'bytes', the size of the
+                encoded request data.
+            request_end: the same, plus 'latency' in seconds,
+                'status_code', and 'error', the exception raised while
+                sending, if any.
+            retry: 'attempt', the number of the attempt about to be
+                made, and 'error', the exception that failed the last.
+            rate_limit: 'remaining', the number of calls left, and
+                'reset_at', when the limit resets in seconds since the
+                epoch, as reported by the server.
+            notify: 'recipients' and 'chunks', the number of parts the
+                description was split into.
+            error: 'error', the exception about to be raised for an
+                error response.
+
+        Hooks are called in the thread sending the request, so they
+        should be quick and thread-safe. Exceptions they raise are
+        logged and ignored.
+
+        Args:
+            event: A string in HOOK_EVENTS.
+            hook: A callable taking a dictionary.
+
+        Raises:
+            ValueError: if event is not in HOOK_EVENTS.
+
+        """
+
+        if event not in HOOK_EVENTS:
+            raise ValueError('unknown hook event: {0}'.format(event))
+
+        # replace the list rather than appending to it, so that threads
+        # emitting the event don't see it change
+
+        self._hooks[event] = self._hooks.get(event, []) + [hook]
 
     def add_key(self, apikey, device_key=''):
         """Add the given key to self.apikeys.
@@ -95,6 +934,23 @@ class AbstractClient(object):
         if device_key and device_key not in self.apikeys[apikey]:
             self.apikeys[apikey].append(device_key)
 
+    def del_hook(self, event, hook):
+        """Stop calling hook for event.
+
+        Args:
+            event: A string in HOOK_EVENTS.
+            hook: A callable previously passed to add_hook.
+
+        """
+
+        hooks = [value for value in self._hooks.get(event, [])
+                 if value != hook]
+
+        if hooks:
+            self._hooks[event] = hooks
+        else:
+            self._hooks.pop(event, None)
+
     def del_key(self, apikey, device_key=''):
         """Delete the given API key or device key from self.apikeys.
 
@@ -115,10 +971,41 @@ class AbstractClient(object):
         else:
             del(self.apikeys[apikey])
 
-    def notify(self, description, event, split=True, kwargs=None):
+    def invalidate_verification(self, apikey=None, device_key=None):
+        """Forget cached verify_user and verify_device results.
+
+        Args:
+            apikey: A string containing the API key to forget the
+                results for, including those for its devices. If None,
+                forget every result for this client's developer key.
+                (default: None)
+            device_key: A string containing a device key of apikey to
+                forget only the verify_device result for.
+                (default: None)
+
+        """
+
+        if self.verify_cache is None:
+            return
+
+        def matches(key):
+            return (key[:2] == (self._type, self.developerkey) and
+                    (apikey is None or key[2] == apikey) and
+                    (device_key is None or key[3] == device_key))
+
+        self.verify_cache.delete_matching(matches)
+
+    def notify(self, description, event, split=True, kwargs=None,
+               report=False):
         """Send a notification to each user/device combination in
         self.apikeys.
 
+        Every client follows the same rules when some deliveries fail:
+        the notification is still sent to every other user and device,
+        each failure is logged as a warning, and then the exception for
+        the first failure is raised, even though others may have been
+        delivered. Use report to find out which were.
+
         Args:
             description: A string containing the main notification text.
                 The maximum length varies by application. See each
@@ -133,6 +1020,9 @@ class AbstractClient(object):
             kwargs: A dictionary for application specific options. See
                 each client's documentation for details.
                 (default: None)
+            report: A boolean indicating whether to return a delivery
+                report instead of raising an exception when any
+                delivery fails. (default: False)
 
         Raises:
             pushnotify.exceptions.ApiKeyError
@@ -142,6 +1032,24 @@ class AbstractClient(object):
             pushnotify.exceptions.UnknownError
             pushnotify.exceptions.UnrecognizedResponseError
 
+        Returns:
+            If report is True, a list of pushnotify.abstract.Responses,
+            one for each chunk of the description sent to each user or
+            device, with these fields:
+                user: A string containing the user's API key.
+                device: A string containing the device key, or None.
+                chunk: An integer containing the index of the chunk in
+                    the split description.
+                status: A boolean indicating whether it was delivered.
+                code: An integer containing the status code from the
+                    server, or None if there wasn't one.
+                receipt: A string containing the receipt for an
+                    emergency priority Pushover notification, or None.
+                latency: A float containing the number of seconds it
+                    took to send, including retries.
+                error: The exception it failed with, if any.
+            Recipients skipped because of the dedup cache are left out.
+
         """
 
         raise NotImplementedError
@@ -172,6 +1080,83 @@ class AbstractClient(object):
 
         raise NotImplementedError
 
+    def verify_many(self, keys, workers=10):
+        """Verify many API keys, or API key and device key pairs,
+        concurrently.
+
+        Keys are taken from keys as workers become free, so keys may be
+        a generator over a very long list. Any rate_limiter and
+        verify_cache the client has are used for each check.
+
+        Args:
+            keys: An iterable of strings containing API keys to check
+                with verify_user, or (apikey, device_key) tuples to
+                check with verify_device.
+            workers: An integer containing the most checks to run at
+                once. (default: 10)
+
+        Raises:
+            Any exception raised while iterating over keys, once the
+            checks already running have finished.
+
+        Returns:
+            A generator of (key, valid, error) tuples, in the order the
+            checks finish. valid is the check's result, or None if it
+            raised the exception in error.
+
+        """
+
+        keys = iter(keys)
+        results = queue.Queue()
+        lock = threading.Lock()
+        stop = threading.Event()
+        done = object()
+        errors = []
+
+        def work():
+            try:
+                while not stop.is_set():
+                    with lock:
+                        try:
+                            key = next(keys, done)
+                        except Exception as exc:
+                            errors.append(exc)
+                            stop.set()
+                            break
+                    if key is done:
+                        break
+
+                    try:
+                        if isinstance(key, tuple):
+                            valid = self.verify_device(*key)
+                        else:
+                            valid = self.verify_user(key)
+                    except Exception as exc:
+                        results.put((key, None, exc))
+                    else:
+                        results.put((key, valid, None))
+            finally:
+                results.put(done)
+
+        threads = [threading.Thread(target=work) for i in range(workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        running = len(threads)
+        try:
+            while running:
+                result = results.get()
+                if result is done:
+                    running -= 1
+                else:
+                    yield result
+        finally:
+            stop.set()
+
+        if errors:
+            raise errors[0]
+
     def verify_user(self, apikey):
         """Verify a user's API key.
 
@@ -200,3 +1185,187 @@ class AbstractClient(object):
             and send back with notify request, with its value describing the sound.
         """
         raise NotImplementedError
+
+
+class AsyncAbstractClient(object):
+    """Abstract client for sending push notifications without blocking
+    the caller. Inherit from this class and set client_class, but don't
+    call it directly.
+
+    Each method that talks to the notification server returns a
+    multiprocessing.pool.AsyncResult right away. Its get method returns
+    what the synchronous client's method would have returned, or raises
+    the same exception. Requests run on a fixed pool of worker threads,
+    so any number of them can be in flight without a thread apiece.
+
+    Member Vars:
+        client: The synchronous client, shared by every worker thread,
+            used to build, send and parse each request.
+        workers: An integer containing the number of requests that can
+            be sent at the same time.
+
+    """
+
+    client_class = AbstractClient
+
+    def __init__(self, developerkey='', application='', workers=10,
+                 **kwargs):
+        """Initialize the client.
+
+        Args:
+            developerkey: A string containing a valid developer key for
+                the client's application.
+            application: A string containing the name of the application
+                on behalf of whom the client will be sending messages.
+            workers: An integer containing the number of requests that
+                can be sent at the same time. (default: 10)
+            kwargs: Any other keyword arguments to pass to client_class,
+                such as session or timeout.
+
+        """
+
+        kwargs.setdefault('pool_maxsize',
+                          max(workers, adapters.DEFAULT_POOLSIZE))
+
+        self.client = self.client_class(developerkey, application, **kwargs)
+        self.workers = workers
+
+        self._pool = ThreadPool(workers)
+
+    @property
+    def apikeys(self):
+
+        return self.client.apikeys
+
+    def _apply(self, method, args, callback):
+
+        return self._pool.apply_async(self._call, (method, args),
+                                      callback=callback)
+
+    def _call(self, method, args):
+
+        return getattr(self.client, method)(*args)
+
+    def add_hook(self, event, hook):
+        """See AbstractClient.add_hook.
+
+        """
+
+        self.client.add_hook(event, hook)
+
+    def add_key(self, apikey, device_key=''):
+        """See AbstractClient.add_key.
+
+        """
+
+        self.client.add_key(apikey, device_key)
+
+    def close(self):
+        """Wait for every pending request to finish, then stop the
+        worker threads.
+
+        """
+
+        self._pool.close()
+        self._pool.join()
+
+    def del_hook(self, event, hook):
+        """See AbstractClient.del_hook.
+
+        """
+
+        self.client.del_hook(event, hook)
+
+    def del_key(self, apikey, device_key=''):
+        """See AbstractClient.del_key.
+
+        """
+
+        self.client.del_key(apikey, device_key)
+
+    def get_sounds(self, callback=None):
+        """See AbstractClient.get_sounds.
+
+        Args:
+            callback: A callable to call with the result once the
+                request succeeds. (default: None)
+
+        Returns:
+            A multiprocessing.pool.AsyncResult.
+
+        """
+
+        return self._apply('get_sounds', (), callback)
+
+    def notify(self, description, event, split=True, kwargs=None,
+               report=False, callback=None):
+        """See AbstractClient.notify.
+
+        Args:
+            callback: A callable to call with the result once the
+                request succeeds. (default: None)
+
+        Returns:
+            A multiprocessing.pool.AsyncResult.
+
+        """
+
+        return self._apply('notify',
+                           (description, event, split, kwargs, report),
+                           callback)
+
+    def retrieve_apikey(self, reg_token, callback=None):
+        """See AbstractClient.retrieve_apikey.
+
+        Args:
+            callback: A callable to call with the result once the
+                request succeeds. (default: None)
+
+        Returns:
+            A multiprocessing.pool.AsyncResult.
+
+        """
+
+        return self._apply('retrieve_apikey', (reg_token,), callback)
+
+    def retrieve_token(self, callback=None):
+        """See AbstractClient.retrieve_token.
+
+        Args:
+            callback: A callable to call with the result once the
+                request succeeds. (default: None)
+
+        Returns:
+            A multiprocessing.pool.AsyncResult.
+
+        """
+
+        return self._apply('retrieve_token', (), callback)
+
+    def verify_device(self, apikey, device_key, callback=None):
+        """See AbstractClient.verify_device.
+
+        Args:
+            callback: A callable to call with the result once the
+                request succeeds. (default: None)
+
+        Returns:
+            A multiprocessing.pool.AsyncResult.
+
+        """
+
+        return self._apply('verify_device', (apikey, device_key), callback)
+
+    def verify_user(self, apikey, callback=None):
+        """See AbstractClient.verify_user.
+
+        Args:
+            callback: A callable to call with the result once the
+                request succeeds. (default: None)
+
+        Returns:
+            A multiprocessing.pool.AsyncResult.
+
+        """
+
+        return self._apply('verify_user', (apikey,), callback)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module for collapsing bursts of similar notifications into one.
+
+"""
+
+import collections
+import logging
+import threading
+
+from pushnotify import abstract
+
+
+class Aggregator(object):
+    """A front-end to a client that holds notifications for a short
+    window and then sends each group of similar ones as one combined
+    notification.
+
+    The first notification in a group starts its window. When the window
+    ends, the group is sent with the first notification's event, and a
+    description listing each distinct description once, with a count if
+    it was repeated. Long combined descriptions are split as usual by
+    the client.
+
+    Groups sent when their window ends are sent in the background, so
+    errors sending them are only logged. Errors sending groups from
+    flush, close or notify are also raised.
+
+    Member Vars:
+        client: The nma.Client, prowl.Client or pushover.Client used to
+            send the combined notifications.
+        window: A float containing the number of seconds to hold a group
+            open for.
+        group_by: A function taking an event and returning the key of
+            the group to put it in. Notifications with different kwargs
+            are never grouped together.
+        max_pending: An integer containing the most notifications to
+            hold in a group before sending it early.
+
+    """
+
+    def __init__(self, client, window=30.0, group_by=None, max_pending=1000):
+        """Initialize the aggregator.
+
+        Args:
+            client: The client used to send notifications.
+            window: A float containing the number of seconds to hold a
+                group open for. (default: 30.0)
+            group_by: A function taking an event and returning its group
+                key. If None, only identical events are grouped.
+                (default: None)
+            max_pending: An integer containing the most notifications to
+                hold in a group before sending it early. (default: 1000)
+
+        """
+
+        self.logger = logging.getLogger('{0}.{1}'.format(
+            self.__module__, self.__class__.__name__))
+
+        self.client = client
+        self.window = window
+        self.group_by = group_by or (lambda event: event)
+        self.max_pending = max_pending
+
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def _send(self, key):
+        """Send the group held under key, if it is still held.
+
+        Returns:
+            The exception sending the group raised, which is also
+            logged, or None.
+
+        """
+
+        with self._lock:
+            group = self._groups.pop(key, None)
+
+        if group is None:
+            return None
+
+        group['timer'].cancel()
+
+        description, event = self.combine(group['notifications'])
+
+        try:
+            self.client.notify(description, event, group['split'],
+                               group['kwargs'])
+        except Exception as exc:
+            self.logger.exception('sending %d combined notifications failed',
+                                  len(group['notifications']))
+            return exc
+
+        return None
+
+    def close(self):
+        """Send every group that is being held.
+
+        Raises:
+            See flush.
+
+        """
+
+        self.flush()
+
+    def combine(self, notifications):
+        """Combine a group of notifications into one.
+
+        Args:
+            notifications: A list of (description, event) tuples.
+
+        Returns:
+            A (description, event) tuple.
+
+        """
+
+        if len(notifications) == 1:
+            return notifications[0]
+
+        # combine as unicode, taking byte strings to be UTF-8 as the
+        # clients do, so that non-ASCII text can't fail to format
+
+        counts = collections.OrderedDict()
+        for description, event in notifications:
+            description = abstract.to_unicode(description)
+            counts[description] = counts.get(description, 0) + 1
+
+        lines = []
+        for description, count in counts.items():
+            if count > 1:
+                lines.append(u'{0} (x{1})'.format(description, count))
+            else:
+                lines.append(description)
+
+        event = u'{0} ({1} notifications)'.format(
+            abstract.to_unicode(notifications[0][1]), len(notifications))
+
+        return u'\n'.join(lines), event
+
+    def flush(self):
+        """Send every group that is being held, now.
+
+        Raises:
+            The exception raised sending the first group that failed,
+            once every group has been tried. Each failure is logged.
+
+        """
+
+        with self._lock:
+            keys = list(self._groups)
+
+        errors = [self._send(key) for key in keys]
+
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def notify(self, description, event, split=True, kwargs=None):
+        """Hold a notification to be sent with others like it.
+
+        Args:
+            description, event, split, kwargs: See the client's notify
+                method.
+
+        Raises:
+            The exception raised sending the group early because it
+            held max_pending notifications, if it failed.
+
+        """
+
+        key = (self.group_by(event),
+               tuple(sorted(kwargs.items())) if kwargs else None)
+
+        with self._lock:
+            group = self._groups.get(key)
+
+            if group is None:
+                timer = threading.Timer(self.window, self._send, (key,))
+                timer.daemon = True
+
+                group = {'notifications': [], 'split': split,
+                         'kwargs': kwargs, 'timer': timer}
+                self._groups[key] = group
+
+                timer.start()
+
+            group['notifications'].append((description, event))
+            full = len(group['notifications']) >= self.max_pending
+
+        if full:
+            error = self._send(key)
+            if error is not None:
+                raise error
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,511 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module for caching results from the notification servers.
+
+"""
+
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class TTLCache(object):
+    """A thread-safe cache whose entries expire after a time to live,
+    holding at most maxsize entries. When it is full, the least recently
+    used entry is evicted.
+
+    Member Vars:
+        maxsize: An integer containing the most entries to hold.
+
+    """
+
+    def __init__(self, maxsize=1024, clock=time.time):
+        """Initialize the cache.
+
+        Args:
+            maxsize: An integer containing the most entries to hold.
+                (default: 1024)
+            clock: A function returning the current time in seconds.
+                (default: time.time)
+
+        """
+
+        self.maxsize = maxsize
+
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+
+        return self.get(key, self) is not self
+
+    def __len__(self):
+
+        return len(self._entries)
+
+    def clear(self):
+        """Remove every entry.
+
+        """
+
+        with self._lock:
+            self._entries.clear()
+
+    def delete(self, key):
+        """Remove the entry for key, if there is one.
+
+        """
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_matching(self, predicate):
+        """Remove every entry whose key predicate returns True for.
+
+        """
+
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def get(self, key, default=None):
+        """Get the value for key.
+
+        Returns:
+            The value, or default if there is no entry for key or it
+            has expired.
+
+        """
+
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                return default
+
+            if expires <= self._clock():
+                return default
+
+            self._entries[key] = (expires, value)
+
+            return value
+
+    def set(self, key, value, ttl):
+        """Set the value for key.
+
+        Args:
+            key: A hashable key.
+            value: The value to store.
+            ttl: A float containing the number of seconds until the
+                entry expires.
+
+        """
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self._clock() + ttl, value)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class VerifyCache(TTLCache):
+    """A cache of verify_user and verify_device results, which keeps
+    valid and invalid results for different lengths of time.
+
+    Member Vars:
+        maxsize: An integer containing the most results to hold.
+        valid_ttl: A float containing the number of seconds to keep a
+            result saying a key is valid.
+        invalid_ttl: A float containing the number of seconds to keep a
+            result saying a key is invalid.
+
+    """
+
+    def __init__(self, valid_ttl=3600.0, invalid_ttl=60.0, maxsize=10000,
+                 clock=time.time):
+        """Initialize the cache.
+
+        Args:
+            valid_ttl: A float containing the number of seconds to keep
+                a result saying a key is valid. (default: 3600.0)
+            invalid_ttl: A float containing the number of seconds to
+                keep a result saying a key is invalid. (default: 60.0)
+            maxsize: An integer containing the most results to hold.
+                (default: 10000)
+            clock: A function returning the current time in seconds.
+                (default: time.time)
+
+        """
+
+        super(VerifyCache, self).__init__(maxsize, clock)
+
+        self.valid_ttl = valid_ttl
+        self.invalid_ttl = invalid_ttl
+
+    def set_result(self, key, result):
+        """Store a verification result for as long as its validity
+        allows.
+
+        """
+
+        self.set(key, result, self.valid_ttl if result else self.invalid_ttl)
+
+
+class DedupCache(TTLCache):
+    """A cache of recently sent notifications, used to skip sending the
+    same notification to the same recipient twice within a window.
+
+    Member Vars:
+        maxsize: An integer containing the most notifications to hold.
+        window: A float containing the number of seconds a notification
+            is remembered for.
+
+    """
+
+    def __init__(self, window=60.0, maxsize=10000, clock=time.time):
+        """Initialize the cache.
+
+        Args:
+            window: A float containing the number of seconds a
+                notification is remembered for. (default: 60.0)
+            maxsize: An integer containing the most notifications to
+                hold. (default: 10000)
+            clock: A function returning the current time in seconds.
+                (default: time.time)
+
+        """
+
+        super(DedupCache, self).__init__(maxsize, clock)
+
+        self.window = window
+
+    def add(self, key, result):
+        """Remember that the notification identified by key was sent,
+        and what notify returned for it.
+
+        """
+
+        self.set(key, result, self.window)
+
+    def add_many(self, items):
+        """Remember several notifications at once.
+
+        Args:
+            items: A list of (key, result) tuples, as passed to add.
+
+        """
+
+        for key, result in items:
+            self.add(key, result)
+
+
+class SQLiteDedupCache(object):
+    """A DedupCache kept in an SQLite database, so that several
+    processes can share it.
+
+    Two processes sending the same notification at the same moment may
+    both send it, since neither has finished when the other checks.
+
+    Expired and excess notifications are only deleted once a tenth of
+    maxsize have been added, or a window has passed, since they last
+    were, so the database may briefly hold more than maxsize.
+
+    Member Vars:
+        path: A string containing the path to the SQLite database.
+        window: A float containing the number of seconds a notification
+            is remembered for.
+        maxsize: An integer containing the most notifications to hold.
+
+    """
+
+    def __init__(self, path, window=60.0, maxsize=100000, clock=time.time):
+        """Initialize the cache, creating the database if needed.
+
+        Args:
+            path: A string containing the path to the SQLite database.
+            window: A float containing the number of seconds a
+                notification is remembered for. (default: 60.0)
+            maxsize: An integer containing the most notifications to
+                hold. (default: 100000)
+            clock: A function returning the current time in seconds.
+                (default: time.time)
+
+        """
+
+        self.path = path
+        self.window = window
+        self.maxsize = maxsize
+
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._added = 0
+        self._pruned = clock()
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('CREATE TABLE IF NOT EXISTS dedup ('
+                         'key TEXT PRIMARY KEY, expires REAL NOT NULL, '
+                         'result TEXT)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS dedup_expires '
+                         'ON dedup (expires)')
+
+    def __contains__(self, key):
+
+        return self.get(key, self) is not self
+
+    def __len__(self):
+
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM dedup WHERE expires > ?',
+                (self._clock(),)).fetchone()[0]
+
+    def _key(self, key):
+
+        # keys hold API keys, so don't write them to disk
+
+        return hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+
+    def _prune(self, now):
+
+        # each delete scans the table, so it isn't done on every add
+
+        if (self._added < max(1, self.maxsize // 10) and
+                now < self._pruned + self.window):
+            return
+
+        self._db.execute('DELETE FROM dedup WHERE expires <= ?', (now,))
+        self._db.execute(
+            'DELETE FROM dedup WHERE key IN (SELECT key FROM dedup '
+            'ORDER BY expires DESC LIMIT -1 OFFSET ?)', (self.maxsize,))
+
+        self._added = 0
+        self._pruned = now
+
+    def add(self, key, result):
+        """Remember that the notification identified by key was sent,
+        and what notify returned for it.
+
+        """
+
+        self.add_many([(key, result)])
+
+    def add_many(self, items):
+        """Remember several notifications at once, in a single
+        transaction.
+
+        Args:
+            items: A list of (key, result) tuples, as passed to add.
+
+        """
+
+        now = self._clock()
+        rows = [(self._key(key), now + self.window, json.dumps(result))
+                for key, result in items]
+
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO dedup (key, expires, result) '
+                    'VALUES (?, ?, ?)', rows)
+                self._added += len(rows)
+                self._prune(now)
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def clear(self):
+        """Remove every notification.
+
+        """
+
+        with self._lock:
+            self._db.execute('DELETE FROM dedup')
+
+    def close(self):
+        """Close the database.
+
+        """
+
+        self._db.close()
+
+    def get(self, key, default=None):
+        """Get what notify returned for the notification identified by
+        key.
+
+        Returns:
+            The result, or default if the notification wasn't sent
+            within the window.
+
+        """
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT result FROM dedup WHERE key = ? AND expires > ?',
+                (self._key(key), self._clock())).fetchone()
+
+        if row is None:
+            return default
+
+        return json.loads(row[0])
+
+
+class SoundsCache(object):
+    """A cache of Pushover sound lists, one per application token,
+    optionally saved to a file so that it outlives the process.
+
+    Within ttl of being fetched or revalidated, a sound list is used as
+    is. After that, the client asks the server whether it has changed,
+    using the ETag and Last-Modified headers it was sent with.
+
+    Member Vars:
+        ttl: A float containing the number of seconds to use a sound
+            list for before revalidating it.
+        path: A string containing the path of the JSON file to keep the
+            cache in, or None to only keep it in memory.
+
+    """
+
+    def __init__(self, ttl=86400.0, path=None, clock=time.time):
+        """Initialize the cache.
+
+        Args:
+            ttl: A float containing the number of seconds to use a sound
+                list for before revalidating it. (default: 86400.0)
+            path: A string containing the path of the JSON file to keep
+                the cache in, or None to only keep it in memory.
+                (default: None)
+            clock: A function returning the current time in seconds.
+                (default: time.time)
+
+        """
+
+        self.ttl = ttl
+        self.path = path
+
+        self._clock = clock
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _key(self, token):
+
+        # tokens are secrets, so don't write them to disk
+
+        return hashlib.sha1(token.encode('utf-8')).hexdigest()
+
+    def _load(self):
+
+        if self._entries is not None:
+            return
+
+        self._entries = {}
+
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path) as fh:
+                    self._entries = json.load(fh)
+            except ValueError:
+                pass
+
+    def _save(self):
+
+        if not self.path:
+            return
+
+        temp = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        with open(temp, 'w') as fh:
+            json.dump(self._entries, fh)
+        os.rename(temp, self.path)
+
+    def clear(self):
+        """Remove every sound list, including from the file.
+
+        """
+
+        with self._lock:
+            self._entries = {}
+            self._save()
+
+    def get(self, token):
+        """Get the cached entry for token.
+
+        Returns:
+            A dictionary with the keys 'sounds', 'etag', 'last_modified'
+            and 'fresh', where fresh is True if the entry can be used
+            without revalidating it, or None if there is no entry.
+
+        """
+
+        with self._lock:
+            self._load()
+            entry = self._entries.get(self._key(token))
+
+            if entry is None:
+                return None
+
+            entry = dict(entry)
+            entry['sounds'] = dict(entry['sounds'])
+            entry['fresh'] = self._clock() < entry.pop('checked') + self.ttl
+
+            return entry
+
+    def set(self, token, sounds, etag=None, last_modified=None):
+        """Store the sound list fetched for token.
+
+        Args:
+            token: A string containing a Pushover application token.
+            sounds: A dictionary as returned by get_sounds.
+            etag: A string containing the response's ETag header.
+                (default: None)
+            last_modified: A string containing the response's
+                Last-Modified header. (default: None)
+
+        """
+
+        with self._lock:
+            self._load()
+            self._entries[self._key(token)] = {
+                'sounds': dict(sounds), 'etag': etag,
+                'last_modified': last_modified, 'checked': self._clock()}
+            self._save()
+
+    def touch(self, token):
+        """Record that the sound list for token is still current.
+
+        """
+
+        with self._lock:
+            self._load()
+            entry = self._entries.get(self._key(token))
+            if entry is not None:
+                entry['checked'] = self._clock()
+                self._save()
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module for collecting metrics from clients' hooks.
+
+"""
+
+import threading
+
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'errors_total': 'Exceptions raised for error responses.',
+    'notifications_total': 'Calls to notify that sent requests.',
+    'notification_chunks_total': 'Parts notify split descriptions into.',
+    'rate_limit_remaining': 'Calls left before the rate limit resets.',
+    'request_bytes_total': 'Bytes of request data sent.',
+    'request_duration_seconds': 'Time taken by requests.',
+    'requests_total': 'Requests sent, by response status code.',
+    'retries_total': 'Requests retried.'}
+
+
+class Collector(object):
+    """Collects delivery metrics from the hooks of any number of clients
+    and renders them in the Prometheus text format.
+
+    Member Vars:
+        prefix: A string prepended to each metric name.
+        buckets: A tuple of floats containing the upper bounds, in
+            seconds, of the request duration histogram's buckets.
+
+    """
+
+    def __init__(self, prefix='pushnotify', buckets=LATENCY_BUCKETS):
+        """Initialize the collector.
+
+        Args:
+            prefix: A string prepended to each metric name.
+                (default: 'pushnotify')
+            buckets: A tuple of floats containing the upper bounds of
+                the request duration histogram's buckets.
+                (default: LATENCY_BUCKETS)
+
+        """
+
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets))
+
+        self._lock = threading.Lock()
+        self._values = {}
+        self._types = {}
+
+    def _add(self, name, labels, amount=1, type_='counter'):
+
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            self._types[name] = type_
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _on_error(self, info):
+
+        self._add('errors_total', {'provider': info['provider'],
+                                   'error': type(info['error']).__name__})
+
+    def _on_notify(self, info):
+
+        labels = {'provider': info['provider']}
+        self._add('notifications_total', labels)
+        self._add('notification_chunks_total', labels, info['chunks'])
+
+    def _on_rate_limit(self, info):
+
+        key = ('rate_limit_remaining', (('provider', info['provider']),))
+
+        with self._lock:
+            self._types['rate_limit_remaining'] = 'gauge'
+            self._values[key] = info['remaining']
+
+    def _on_request_end(self, info):
+
+        labels = {'provider': info['provider'], 'method': info['method']}
+
+        if info['error'] is not None:
+            status = type(info['error']).__name__
+        else:
+            status = str(info['status_code'])
+
+        self._add('requests_total', dict(labels, status=status))
+        self._add('request_bytes_total', labels, info['bytes'])
+
+        self._add('request_duration_seconds_sum', labels, info['latency'],
+                  'histogram')
+        self._add('request_duration_seconds_count', labels, 1, 'histogram')
+        for bucket in self.buckets + (float('inf'),):
+            if info['latency'] <= bucket:
+                self._add('request_duration_seconds_bucket',
+                          dict(labels, le=_format(bucket)), 1, 'histogram')
+
+    def _on_retry(self, info):
+
+        self._add('retries_total', {'provider': info['provider']})
+
+    def _hooks(self):
+
+        return [('error', self._on_error),
+                ('notify', self._on_notify),
+                ('rate_limit', self._on_rate_limit),
+                ('request_end', self._on_request_end),
+                ('retry', self._on_retry)]
+
+    def attach(self, client):
+        """Start collecting metrics from client.
+
+        Args:
+            client: An nma.Client, prowl.Client, pushover.Client, or
+                one of their AsyncClients.
+
+        """
+
+        for event, hook in self._hooks():
+            client.add_hook(event, hook)
+
+    def detach(self, client):
+        """Stop collecting metrics from client.
+
+        """
+
+        for event, hook in self._hooks():
+            client.del_hook(event, hook)
+
+    def get(self, name, **labels):
+        """Get the current value of a metric.
+
+        Args:
+            name: A string containing the metric's name, without the
+                prefix, such as 'requests_total'.
+            labels: The metric's labels, such as provider='prowl'.
+
+        Returns:
+            A number, which is 0 if nothing has been recorded for the
+            metric.
+
+        """
+
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def merge(self, snapshot):
+        """Add the metrics in another collector's snapshot to this
+        collector's. Counters and histograms are summed, and gauges are
+        set to the snapshot's value.
+
+        Args:
+            snapshot: A dictionary returned by snapshot.
+
+        """
+
+        types = snapshot['types']
+
+        with self._lock:
+            self._types.update(types)
+
+            for key, value in snapshot['values'].items():
+                if types[key[0]] == 'gauge':
+                    self._values[key] = value
+                else:
+                    self._values[key] = self._values.get(key, 0) + value
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            A string.
+
+        """
+
+        with self._lock:
+            values = sorted(self._values.items(), key=_sort_key)
+            types = dict(self._types)
+
+        lines = []
+        family = None
+
+        for (name, labels), value in values:
+            base = name
+            for suffix in ('_bucket', '_count', '_sum'):
+                if types[name] == 'histogram' and name.endswith(suffix):
+                    base = name[:-len(suffix)]
+
+            if base != family:
+                family = base
+                lines.append('# HELP {0}_{1} {2}'.format(
+                    self.prefix, base, HELP.get(base, base)))
+                lines.append('# TYPE {0}_{1} {2}'.format(
+                    self.prefix, base, types[name]))
+
+            if labels:
+                label_text = '{{{0}}}'.format(','.join(
+                    '{0}="{1}"'.format(key, _escape(label))
+                    for key, label in labels))
+            else:
+                label_text = ''
+
+            lines.append('{0}_{1}{2} {3}'.format(
+                self.prefix, name, label_text, _format(value)))
+
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """Get the current value of every metric, such as to pass to
+        another process's collector.
+
+        Returns:
+            A dictionary that can be pickled and passed to merge.
+
+        """
+
+        with self._lock:
+            return {'types': dict(self._types),
+                    'values': dict(self._values)}
+
+
+def _escape(value):
+
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _sort_key(item):
+
+    # order histogram buckets by their bounds rather than as strings
+
+    (name, labels), value = item
+
+    return name, [(key, float(label) if key == 'le' else label)
+                  for key, label in labels]
+
+
+def _format(value):
+
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+if __name__ == '__main__':
+    pass
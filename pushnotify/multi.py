@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module for sending one notification to recipients of several
+notification services at once.
+
+"""
+
+import logging
+import time
+
+from requests import adapters
+
+import pushnotify
+from pushnotify import abstract
+
+
+class MultiClient(object):
+    """A registry of recipients, each using one of the notification
+    services, that notify sends to concurrently.
+
+    Each recipient gets a client of their own, so that one recipient's
+    failure is reported for them alone rather than raised for everyone.
+    All the clients share one session, and so one pool of connections
+    per service.
+
+    Member Vars:
+        developerkeys: A dictionary where the keys are client types,
+            such as 'pushover', and the values are strings containing
+            the developer key to use for that type.
+        application: A string containing the name of the application on
+            behalf of whom messages are sent.
+        workers: An integer containing the maximum number of recipients
+            to send to concurrently.
+        recipients: A dictionary where the keys are strings containing
+            recipient names, and the values are the clients that send to
+            them.
+
+    """
+
+    def __init__(self, developerkeys=None, application='', workers=10,
+                 **kwargs):
+        """Initialize the client.
+
+        Args:
+            developerkeys: A dictionary mapping client types to developer
+                keys. (default: None)
+            application: A string containing the name of the
+                application on behalf of whom messages are sent.
+                (default: '')
+            workers: An integer containing the maximum number of
+                recipients to send to concurrently. (default: 10)
+            kwargs: Any other keyword arguments accepted by the clients,
+                such as timeout, retry_policy or session. See
+                abstract.AbstractClient for details.
+
+        """
+
+        self.logger = logging.getLogger('{0}.{1}'.format(
+            self.__module__, self.__class__.__name__))
+
+        if kwargs.get('session') is None:
+            kwargs['session'] = abstract.make_session(
+                pool_maxsize=max(workers, adapters.DEFAULT_POOLSIZE))
+
+        self.developerkeys = dict(developerkeys or {})
+        self.application = application
+        self.workers = workers
+        self.recipients = {}
+
+        self._kwargs = kwargs
+
+    def add_recipient(self, name, type_, apikey, device_key=''):
+        """Add a recipient, or another key for an existing one.
+
+        Args:
+            name: A string identifying the recipient.
+            type_: A string containing the type of client the recipient
+                uses: 'nma', 'prowl' or 'pushover'.
+            apikey: A string containing the recipient's API key.
+            device_key: A string containing a device key to go along
+                with the API key. (default: '')
+
+        Raises:
+            ValueError: if type_ is not a client type, or name was
+                added with a different one.
+
+        """
+
+        type_ = type_.lower()
+        client = self.recipients.get(name)
+
+        if client is None:
+            client = pushnotify.get_client(
+                type_, self.developerkeys.get(type_, ''), self.application,
+                **self._kwargs)
+            if client is None:
+                raise ValueError('unknown client type: {0}'.format(type_))
+            self.recipients[name] = client
+        elif client._type != type_:
+            raise ValueError('{0} already uses {1}'.format(name,
+                                                           client._type))
+
+        client.add_key(apikey, device_key)
+
+    def del_recipient(self, name):
+        """Delete a recipient.
+
+        Args:
+            name: A string identifying a recipient in self.recipients.
+
+        """
+
+        del self.recipients[name]
+
+    def notify(self, description, event, split=True, kwargs=None,
+               provider_kwargs=None, report=False):
+        """Send a notification to every recipient.
+
+        Args:
+            description, event, split, kwargs: See the clients' notify
+                methods. kwargs are sent to every recipient.
+            provider_kwargs: A dictionary mapping client types to
+                dictionaries of options sent only to recipients using
+                that type, such as {'pushover': {'sound': 'siren'}}.
+                They override kwargs. (default: None)
+            report: A boolean indicating whether to get a delivery
+                report from each client. See AbstractClient.notify.
+                (default: False)
+
+        Returns:
+            A dictionary where the keys are recipient names, and the
+            values are pushnotify.abstract.Responses with these fields:
+                provider: A string containing the client type.
+                status: A boolean indicating whether the notification
+                    was sent, or if report is True, whether every part
+                    of it was delivered.
+                result: What the client's notify returned, if it was,
+                    which is the delivery report if report is True.
+                error: The exception it raised, if it wasn't.
+                latency: A float containing the number of seconds it
+                    took.
+
+        """
+
+        provider_kwargs = provider_kwargs or {}
+
+        def send(name):
+            client = self.recipients[name]
+
+            these_kwargs = dict(kwargs or {})
+            these_kwargs.update(provider_kwargs.get(client._type, {}))
+
+            start = time.time()
+            try:
+                result = client.notify(description, event, split,
+                                       these_kwargs or None, report)
+            except Exception as exc:
+                self.logger.warning('notify failed for %s: %r', name, exc)
+                result, error = None, exc
+            else:
+                error = None
+
+            status = error is None
+            if status and report:
+                status = all(record['status'] for record in result)
+
+            return abstract.Response(provider=client._type,
+                                     status=status, result=result,
+                                     error=error,
+                                     latency=time.time() - start)
+
+        names = list(self.recipients)
+
+        return dict(zip(names, abstract.map_threads(send, names,
+                                                    self.workers)))
+
+
+if __name__ == '__main__':
+    pass
@@ -25,6 +25,7 @@ information.
 """
 
 
+import time
 import warnings
 try:
     from xml.etree import cElementTree
@@ -41,6 +42,7 @@ VERIFY_URL = u'/'.join([PUBLIC_API_URL, 'verify'])
 NOTIFY_URL = u'/'.join([PUBLIC_API_URL, 'notify'])
 
 DESC_LIMIT = 10000
+KEY_LIMIT = 5
 
 
 class Client(abstract.AbstractClient):
@@ -59,7 +61,7 @@ class Client(abstract.AbstractClient):
 
     """
 
-    def __init__(self, developerkey='', application=''):
+    def __init__(self, developerkey='', application='', **kwargs):
         """Initialize the Notify My Android client.
 
         Args:
@@ -68,59 +70,92 @@ class Client(abstract.AbstractClient):
             application: A string containing the name of the application
                 on behalf of whom the NMA client will be sending
                 messages.
+            kwargs: Any other keyword arguments accepted by
+                abstract.AbstractClient, such as session or timeout.
 
         """
 
-        super(self.__class__, self).__init__(developerkey, application)
+        super(self.__class__, self).__init__(developerkey, application,
+                                             **kwargs)
 
         self._type = 'nma'
         self._urls = {'notify': NOTIFY_URL, 'verify': VERIFY_URL}
 
     def _parse_response(self, response, verify=False):
 
-        xmlresp = response.text
-        root = ElementTree.fromstring(xmlresp)
-
-        self._last['type'] = root[0].tag.lower()
-        self._last['code'] = root[0].attrib['code']
-
-        if self._last['type'] == 'success':
-            self._last['message'] = None
-            self._last['remaining'] = root[0].attrib['remaining']
-            self._last['resettimer'] = root[0].attrib['resettimer']
-        elif self._last['type'] == 'error':
-            self._last['message'] = root[0].text
-            self._last['remaining'] = None
-            self._last['resettimer'] = None
-
-            if (not verify or
-                    (self._last['code'] != '400' and
-                        self._last['code'] != '401')):
-                self._raise_exception()
+        # parse the raw bytes, which the XML declaration says how to
+        # decode, rather than having requests decode them to text first
+
+        root = self._parse_xml(response)
+
+        fields = {'type': root[0].tag.lower(),
+                  'code': root[0].attrib['code']}
+
+        if fields['type'] == 'success':
+            fields['message'] = None
+            fields['remaining'] = root[0].attrib['remaining']
+            fields['resettimer'] = root[0].attrib['resettimer']
+        elif fields['type'] == 'error':
+            fields['message'] = root[0].text
+            fields['remaining'] = None
+            fields['resettimer'] = None
         else:
-            raise exceptions.UnrecognizedResponseError(xmlresp, -1)
+            raise exceptions.UnrecognizedResponseError(response.text, -1)
+
+        parsed = abstract.Response(fields)
+        self._last = parsed
+
+        if parsed['remaining'] is not None:
+            # resettimer is the number of minutes until the reset
+
+            remaining = int(parsed['remaining'])
+            reset_at = time.time() + 60 * int(parsed['resettimer'])
+
+            self._emit('rate_limit', remaining=remaining, reset_at=reset_at)
+            if self.rate_limiter is not None:
+                self.rate_limiter.update(remaining, reset_at)
+        elif parsed['code'] == '402' and self.rate_limiter is not None:
+            self.rate_limiter.exceeded()
+
+        if (parsed['type'] == 'error' and
+                (not verify or
+                    (parsed['code'] != '400' and parsed['code'] != '401'))):
+            self._raise_error(parsed)
+
+        return parsed
+
+    def _parse_xml(self, response):
+
+        try:
+            root = ElementTree.fromstring(response.content)
+            root[0].attrib['code']
+        except (SyntaxError, IndexError, KeyError):
+            # a proxy in front of the server may answer with an HTML page
+
+            self._unparseable(response)
 
         return root
 
-    def _raise_exception(self):
-
-        if self._last['code'] == '400':
-            raise exceptions.FormatError(self._last['message'],
-                                         int(self._last['code']))
-        elif self._last['code'] == '401':
-            raise exceptions.ApiKeyError(self._last['message'],
-                                         int(self._last['code']))
-        elif self._last['code'] == '402':
-            raise exceptions.RateLimitExceeded(self._last['message'],
-                                               int(self._last['code']))
-        elif self._last['code'] == '500':
-            raise exceptions.ServerError(self._last['message'],
-                                         int(self._last['code']))
+    def _raise_exception(self, response):
+
+        if response['code'] == '400':
+            raise exceptions.FormatError(response['message'],
+                                         int(response['code']))
+        elif response['code'] == '401':
+            raise exceptions.ApiKeyError(response['message'],
+                                         int(response['code']))
+        elif response['code'] == '402':
+            raise exceptions.RateLimitExceeded(response['message'],
+                                               int(response['code']))
+        elif response['code'] == '500':
+            raise exceptions.ServerError(response['message'],
+                                         int(response['code']))
         else:
-            raise exceptions.UnknownError(self._last['message'],
-                                          int(self._last['code']))
+            raise exceptions.UnknownError(response['message'],
+                                          int(response['code']))
 
-    def notify(self, description, event, split=True, kwargs=None):
+    def notify(self, description, event, split=True, kwargs=None,
+               report=False):
         """Send a notification to each user's apikey in self.apikeys.
 
         Args:
@@ -142,6 +177,9 @@ class Client(abstract.AbstractClient):
                     the quotes) that then allows some basic HTML to be
                     used while displaying the notification.
                 (default: None)
+            report: A boolean indicating whether to return a delivery
+                report instead of raising an exception when any
+                delivery fails. (default: False)
 
         Raises:
             pushnotify.exceptions.ApiKeyError
@@ -152,38 +190,23 @@ class Client(abstract.AbstractClient):
             pushnotify.exceptions.UnrecognizedResponseError
 
         Returns:
-            True.
+            True, or a delivery report if report is True. See
+            AbstractClient.notify.
 
-        """
-
-        def send_notify(description, event, kwargs):
-            data = {'apikey': ','.join(self.apikeys),
-                    'application': self.application,
-                    'event': event,
-                    'description': description}
+        The API keys are sent KEY_LIMIT at a time. If self.workers is
+        greater than 1, the batches are sent concurrently. A failed
+        batch fails for every key in it. When making a delivery report,
+        the keys in a batch rejected for an invalid key are sent to one
+        at a time, to find out which is invalid.
 
-            if self.developerkey:
-                data['developerkey'] = self.developerkey
-
-            if kwargs:
-                data.update(kwargs)
-
-            response = self._post(self._urls['notify'], data)
-            self._parse_response(response)
-
-        if not self.apikeys:
-            self.logger.warn('notify called with no users set')
-            return
+        """
 
-        if split:
-            while description:
-                this_desc = description[0:DESC_LIMIT]
-                description = description[DESC_LIMIT:]
-                send_notify(this_desc, event, kwargs)
-        else:
-            send_notify(description, event, kwargs)
+        fields = {'application': self.application, 'event': event}
+        if self.developerkey:
+            fields['developerkey'] = self.developerkey
 
-        return True
+        return self._notify_batches(description, event, split, kwargs,
+                                    report, fields, DESC_LIMIT, KEY_LIMIT)
 
     def verify(self, apikey):
         """This method is deprecated. Use verify_user instead.
@@ -215,15 +238,28 @@ class Client(abstract.AbstractClient):
 
         """
 
-        data = {'apikey': apikey}
+        def verify():
+            data = {'apikey': apikey}
 
-        if self.developerkey:
-            data['developerkey'] = self.developerkey
+            if self.developerkey:
+                data['developerkey'] = self.developerkey
+
+            response = self._parse_response(
+                self._get(self._urls['verify'], data), True)
+
+            return response['code'] == '200'
+
+        return self._verify_cached(verify, apikey)
 
-        response = self._get(self._urls['verify'], data)
-        self._parse_response(response, True)
 
-        return self._last['code'] == '200'
+class AsyncClient(abstract.AsyncAbstractClient):
+    """Client for sending push notifications to Android devices with
+    the Notify My Android (NMA) application installed, without blocking
+    the caller. See abstract.AsyncAbstractClient.
+
+    """
+
+    client_class = Client
 
 if __name__ == '__main__':
     pass
@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module for queueing notifications on disk and sending them in the
+background.
+
+"""
+
+import copy
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from pushnotify import abstract
+from pushnotify import exceptions
+from pushnotify import retry
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    description TEXT NOT NULL,
+    event TEXT NOT NULL,
+    split INTEGER NOT NULL,
+    kwargs TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    claimed_at REAL,
+    error TEXT,
+    recipients TEXT
+)
+'''
+
+PENDING = 'pending'
+SENDING = 'sending'
+FAILED = 'failed'
+
+
+class Outbox(object):
+    """A queue of notifications, kept in an SQLite database, that are
+    sent through a client by a background thread.
+
+    notify returns as soon as the notification is safely on disk. A
+    notification is only removed once the client has sent it, so any
+    that were being sent when the process died are sent again when the
+    outbox is next opened. Several processes may share one database.
+
+    Notifications are sent to the client's keys at the time they're
+    sent, not at the time they're queued. When only some of the users
+    and devices fail, a retry is sent to just those that failed, and
+    only those are kept in the failed state.
+
+    Member Vars:
+        client: The nma.Client, prowl.Client or pushover.Client used to
+            send the notifications.
+        path: A string containing the path to the SQLite database.
+        retry_policy: A pushnotify.retry.RetryPolicy deciding which
+            errors are retried, how many times, and how long to wait
+            between attempts. Notifications that fail with any other
+            error, or run out of attempts, are kept in the failed state.
+        lease: A float containing the number of seconds after which a
+            notification that is still being sent is assumed to have
+            been abandoned by a crashed dispatcher.
+        poll_interval: A float containing the number of seconds the
+            background thread waits when there is nothing to send.
+
+    """
+
+    def __init__(self, client, path, retry_policy=None, lease=300.0,
+                 poll_interval=1.0):
+        """Initialize the outbox, creating the database if needed.
+
+        Args:
+            client: The client used to send the notifications.
+            path: A string containing the path to the SQLite database.
+            retry_policy: A pushnotify.retry.RetryPolicy. If None, a
+                policy allowing 10 attempts, up to 5 minutes apart, that
+                also retries pushnotify.exceptions.RateLimitExceeded.
+                (default: None)
+            lease: A float containing the number of seconds after which
+                an unacknowledged notification is sent again.
+                (default: 300.0)
+            poll_interval: A float containing the number of seconds to
+                wait when there is nothing to send. (default: 1.0)
+
+        """
+
+        self.logger = logging.getLogger('{0}.{1}'.format(
+            self.__module__, self.__class__.__name__))
+
+        if retry_policy is None:
+            retry_policy = retry.RetryPolicy(
+                max_attempts=10, backoff_base=1.0, backoff_cap=300.0,
+                retry_on=retry.RETRYABLE + (exceptions.RateLimitExceeded,))
+
+        self.client = client
+        self.path = path
+        self.retry_policy = retry_policy
+        self.lease = lease
+        self.poll_interval = poll_interval
+
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute(SCHEMA)
+        self._migrate()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _claim(self):
+
+        now = time.time()
+
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                while True:
+                    row = self._db.execute(
+                        'SELECT id, description, event, split, kwargs, '
+                        'attempts, recipients FROM outbox WHERE '
+                        '(state = ? AND next_attempt <= ?) OR '
+                        '(state = ? AND claimed_at <= ?) ORDER BY id LIMIT 1',
+                        (PENDING, now, SENDING, now - self.lease)).fetchone()
+
+                    # a notification abandoned on its last attempt, such
+                    # as one that crashes the dispatcher, is not retried
+
+                    if (row is None or
+                            row[5] < self.retry_policy.max_attempts):
+                        break
+
+                    self.logger.warning(
+                        'notification %d abandoned after %d attempts',
+                        row[0], row[5])
+                    self._db.execute(
+                        'UPDATE outbox SET state = ?, error = ? '
+                        'WHERE id = ?',
+                        (FAILED, 'abandoned after {0} attempts'.format(
+                            row[5]), row[0]))
+
+                if row is not None:
+                    self._db.execute(
+                        'UPDATE outbox SET state = ?, claimed_at = ?, '
+                        'attempts = attempts + 1 WHERE id = ?',
+                        (SENDING, now, row[0]))
+
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+
+        return row
+
+    def _execute(self, sql, args=()):
+
+        with self._lock:
+            cursor = self._db.execute(sql, args)
+            return cursor.lastrowid, cursor.fetchall()
+
+    def _fail(self, id_, exc, recipients):
+
+        self.logger.warning('notification %d failed: %r', id_, exc)
+        self._execute(
+            'UPDATE outbox SET state = ?, error = ?, recipients = ? '
+            'WHERE id = ?', (FAILED, repr(exc), recipients, id_))
+
+    def _migrate(self):
+
+        # databases made before recipients were tracked lack the column
+
+        columns = [row[1] for row
+                   in self._db.execute('PRAGMA table_info(outbox)')]
+        if 'recipients' in columns:
+            return
+
+        try:
+            self._db.execute('ALTER TABLE outbox ADD COLUMN recipients TEXT')
+        except sqlite3.OperationalError:
+            # another process added it first
+            pass
+
+    def _recipients(self, recipients):
+
+        # restrict a retry to the users and devices that failed, as long
+        # as the client still has them
+
+        if not recipients:
+            return self.client
+
+        client = copy.copy(self.client)
+        client.apikeys = {}
+        for user, device in json.loads(recipients):
+            if user in self.client.apikeys:
+                client.add_key(user, device or '')
+
+        return client
+
+    def _reschedule(self, id_, attempts, exc, recipients):
+
+        backoff = self.retry_policy.backoff(attempts + 1)
+        self.logger.info(
+            'notification %d failed (%r), retrying in %.2f seconds',
+            id_, exc, backoff)
+        self._execute(
+            'UPDATE outbox SET state = ?, next_attempt = ?, '
+            'claimed_at = NULL, error = ?, recipients = ? WHERE id = ?',
+            (PENDING, time.time() + backoff, repr(exc), recipients, id_))
+
+    def _settle(self, row, report):
+
+        id_, description, event, split, kwargs, attempts, recipients = row
+
+        failures = []
+        seen = set()
+        for record in report or []:
+            recipient = (record['user'], record['device'])
+            if not record['status'] and recipient not in seen:
+                seen.add(recipient)
+                failures.append((recipient, record['error']))
+
+        last_attempt = attempts + 1 >= self.retry_policy.max_attempts
+        retries = [failure for failure in failures if not last_attempt and
+                   isinstance(failure[1], self.retry_policy.retry_on)]
+        failed = [failure for failure in failures if failure not in retries]
+
+        if retries:
+            self._reschedule(id_, attempts, retries[0][1], json.dumps(
+                [recipient for recipient, error in retries]))
+        if failed and retries:
+            self.logger.warning('notification %d failed: %r', id_,
+                                failed[0][1])
+            self._execute(
+                'INSERT INTO outbox (description, event, split, kwargs, '
+                'state, attempts, next_attempt, error, recipients) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (description, event, split, kwargs, FAILED, attempts + 1,
+                 time.time(), repr(failed[0][1]), json.dumps(
+                     [recipient for recipient, error in failed])))
+        elif failed:
+            self._fail(id_, failed[0][1], json.dumps(
+                [recipient for recipient, error in failed]))
+        elif not retries:
+            self._execute('DELETE FROM outbox WHERE id = ?', (id_,))
+
+    def _run(self):
+
+        while not self._stop.is_set():
+            try:
+                sent = self.dispatch()
+            except Exception:
+                self.logger.exception('dispatch failed')
+                sent = False
+
+            if not sent:
+                self._stop.wait(self.poll_interval)
+
+    def close(self):
+        """Stop the background thread, if running, and close the
+        database.
+
+        """
+
+        self.stop()
+        self._db.close()
+
+    def dispatch(self):
+        """Send the oldest notification that is due, if any.
+
+        Returns:
+            A boolean containing True if a notification was tried, and
+            False if none were due.
+
+        """
+
+        row = self._claim()
+        if row is None:
+            return False
+
+        id_, description, event, split, kwargs, attempts, recipients = row
+        client = self._recipients(recipients)
+
+        try:
+            report = client.notify(description, event, bool(split),
+                                   json.loads(kwargs) if kwargs else None,
+                                   report=True)
+        except self.retry_policy.retry_on as exc:
+            if attempts + 1 >= self.retry_policy.max_attempts:
+                self._fail(id_, exc, recipients)
+            else:
+                self._reschedule(id_, attempts, exc, recipients)
+        except exceptions.PushNotifyError as exc:
+            self._fail(id_, exc, recipients)
+        except Exception as exc:
+            # anything else, such as a description too long to send
+            # without splitting, isn't known to be temporary
+
+            self._fail(id_, exc, recipients)
+        else:
+            self._settle(row, report)
+
+        return True
+
+    def drain(self):
+        """Send every notification that is due, in the calling thread.
+
+        Returns:
+            An integer containing the number of notifications tried.
+
+        """
+
+        count = 0
+        while self.dispatch():
+            count += 1
+
+        return count
+
+    def failed(self):
+        """Get the notifications that could not be sent.
+
+        Returns:
+            A list of (id, description, event, error) tuples.
+
+        """
+
+        return self._execute(
+            'SELECT id, description, event, error FROM outbox '
+            'WHERE state = ? ORDER BY id', (FAILED,))[1]
+
+    def notify(self, description, event, split=True, kwargs=None):
+        """Queue a notification to be sent by client.notify.
+
+        Args:
+            description, event, split, kwargs: See the client's notify
+                method.
+
+        Returns:
+            An integer identifying the queued notification.
+
+        """
+
+        rowid, rows = self._execute(
+            'INSERT INTO outbox (description, event, split, kwargs, '
+            'next_attempt) VALUES (?, ?, ?, ?, ?)',
+            (abstract.to_unicode(description), abstract.to_unicode(event),
+             int(split), json.dumps(kwargs) if kwargs else None,
+             time.time()))
+
+        return rowid
+
+    def pending(self):
+        """Get the number of notifications waiting to be sent.
+
+        Returns:
+            An integer.
+
+        """
+
+        return self._execute(
+            'SELECT COUNT(*) FROM outbox WHERE state != ?',
+            (FAILED,))[1][0][0]
+
+    def start(self):
+        """Start sending queued notifications in a background thread.
+
+        """
+
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='pushnotify-outbox')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the background thread once it finishes the notification
+        it is sending, if any.
+
+        Args:
+            timeout: A float containing the most seconds to wait for it,
+                or None to wait as long as it takes. (default: None)
+
+        """
+
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module for sending one notification to a very large number of
+recipients using several processes.
+
+"""
+
+import logging
+import multiprocessing
+
+import pushnotify
+from pushnotify import abstract
+from pushnotify import metrics
+
+
+# the client each worker process sends with, made by _init_worker
+
+_client = None
+_buckets = metrics.LATENCY_BUCKETS
+
+
+def _init_worker(type_, developerkey, application, setup, buckets,
+                 kwargs):
+    """Make the worker process's client.
+
+    """
+
+    global _client, _buckets
+
+    _client = pushnotify.get_client(type_, developerkey, application,
+                                    **kwargs)
+    _buckets = buckets
+
+    if setup is not None:
+        setup(_client)
+
+
+def _send_shard(task):
+    """Send a notification to one shard of the recipients with the
+    worker process's client.
+
+    Returns:
+        A (report, snapshot) tuple of the client's delivery report and a
+        snapshot of the metrics collected while sending.
+
+    """
+
+    recipients, description, event, split, kwargs = task
+
+    apikeys = {}
+    for apikey, device_key in recipients:
+        devices = apikeys.setdefault(apikey, [])
+        if device_key and device_key not in devices:
+            devices.append(device_key)
+
+    collector = metrics.Collector(buckets=_buckets)
+    collector.attach(_client)
+    _client.apikeys = apikeys
+
+    try:
+        report = _client.notify(description, event, split, kwargs,
+                                report=True)
+    finally:
+        collector.detach(_client)
+
+    return report or [], collector.snapshot()
+
+
+class ProcessPoolSender(object):
+    """Sends notifications to a very large number of recipients of one
+    notification service by splitting them into shards and sending each
+    shard from one of a pool of worker processes.
+
+    Encoding requests, parsing responses and logging all take CPU time
+    that threads, holding the GIL, can't spread across cores. Each
+    worker has a client and session of its own, made when it starts, and
+    sends its shards with that client's workers threads.
+
+    Member Vars:
+        type_: A string containing the type of client: 'nma', 'prowl' or
+            'pushover'.
+        processes: An integer containing the number of worker processes.
+        shard_size: An integer containing the most user/device
+            combinations sent to by one worker at a time.
+        collector: A pushnotify.metrics.Collector holding the metrics
+            collected by every worker.
+
+    """
+
+    def __init__(self, type_, developerkey='', application='',
+                 processes=None, shard_size=1000, setup=None, **kwargs):
+        """Initialize the sender and start its worker processes.
+
+        Args:
+            type_: A string containing the type of client: 'nma',
+                'prowl' or 'pushover'.
+            developerkey: A string containing the developer key for
+                the client's application. (default: '')
+            application: A string containing the name of the
+                application on behalf of whom messages are sent.
+                (default: '')
+            processes: An integer containing the number of worker
+                processes. If None, the number of CPUs. (default: None)
+            shard_size: An integer containing the most user/device
+                combinations sent to by one worker at a time.
+                (default: 1000)
+            setup: A function called with each worker's client once it
+                is made, such as to point it at a mock server.
+                (default: None)
+            kwargs: Any other keyword arguments accepted by the client,
+                such as workers, timeout or retry_policy. Each worker
+                gets its own copy, so rate limiters and caches aren't
+                shared between workers. Where processes are spawned
+                rather than forked, they and setup must be picklable.
+
+        Raises:
+            ValueError: if type_ is not a client type, or a session is
+                given, since a session can't be shared between
+                processes.
+
+        """
+
+        self.logger = logging.getLogger('{0}.{1}'.format(
+            self.__module__, self.__class__.__name__))
+
+        type_ = type_.lower()
+        if type_ not in pushnotify.CLIENT_MODULES:
+            raise ValueError('unknown client type: {0}'.format(type_))
+        if kwargs.get('session') is not None:
+            raise ValueError('each worker process needs its own session')
+
+        self.type_ = type_
+        self.processes = processes or multiprocessing.cpu_count()
+        self.shard_size = shard_size
+        self.collector = metrics.Collector()
+
+        self._pool = multiprocessing.Pool(
+            self.processes, _init_worker,
+            (type_, developerkey, application, setup,
+             self.collector.buckets, kwargs))
+
+    def close(self):
+        """Wait for every shard being sent to finish, then stop the
+        worker processes.
+
+        """
+
+        self._pool.close()
+        self._pool.join()
+
+    def notify(self, recipients, description, event, split=True,
+               kwargs=None):
+        """Send a notification to every recipient.
+
+        Args:
+            recipients: A dictionary in the same form as a client's
+                apikeys, where the keys are strings containing API keys,
+                and the values are lists of device keys, which may be
+                empty.
+            description, event, split, kwargs: See the client's notify
+                method.
+
+        Returns:
+            The delivery reports of every shard, in one list. See
+            AbstractClient.notify. The metrics collected while sending
+            are added to self.collector.
+
+        """
+
+        deliveries = abstract.expand_apikeys(recipients)
+
+        tasks = [(deliveries[start:start + self.shard_size], description,
+                  event, split, kwargs)
+                 for start in range(0, len(deliveries), self.shard_size)]
+
+        self.logger.debug('sending to %d recipients in %d shards',
+                          len(deliveries), len(tasks))
+
+        report = []
+        for records, snapshot in self._pool.imap(_send_shard, tasks):
+            report.extend(records)
+            self.collector.merge(snapshot)
+
+        return report
+
+
+if __name__ == '__main__':
+    pass
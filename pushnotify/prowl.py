@@ -24,7 +24,6 @@ information.
 
 """
 
-
 try:
     from xml.etree import cElementTree
     ElementTree = cElementTree
@@ -42,6 +41,7 @@ RETRIEVE_TOKEN_URL = u'/'.join([PUBLIC_API_URL, 'retrieve', 'token'])
 RETRIEVE_APIKEY_URL = u'/'.join([PUBLIC_API_URL, 'retrieve', 'apikey'])
 
 DESC_LIMIT = 10000
+KEY_LIMIT = 5
 
 
 class Client(abstract.AbstractClient):
@@ -60,7 +60,7 @@ class Client(abstract.AbstractClient):
 
     """
 
-    def __init__(self, developerkey='', application=''):
+    def __init__(self, developerkey='', application='', **kwargs):
         """Initialize the Prowl client.
 
         Args:
@@ -69,10 +69,13 @@ class Client(abstract.AbstractClient):
             application: A string containing the name of the application
                 on behalf of whom the Prowl client will be sending
                 messages.
+            kwargs: Any other keyword arguments accepted by
+                abstract.AbstractClient, such as session or timeout.
 
         """
 
-        super(self.__class__, self).__init__(developerkey, application)
+        super(self.__class__, self).__init__(developerkey, application,
+                                             **kwargs)
 
         self._type = 'prowl'
         self._urls = {'notify': NOTIFY_URL, 'verify': VERIFY_URL,
@@ -81,73 +84,103 @@ class Client(abstract.AbstractClient):
 
     def _parse_response(self, response, verify=False):
 
-        xmlresp = response.text
-        self.logger.info('received response: {0}'.format(xmlresp))
+        # parse the raw bytes, which the XML declaration says how to
+        # decode, rather than having requests decode them to text first
 
-        root = ElementTree.fromstring(xmlresp)
+        xmlresp = response.content
+        self.logger.info('received response: %s', self._loggable(xmlresp))
 
-        self._last['type'] = root[0].tag.lower()
-        self._last['code'] = root[0].attrib['code']
+        root = self._parse_xml(response)
 
-        if self._last['type'] == 'success':
-            self._last['message'] = None
-            self._last['remaining'] = root[0].attrib['remaining']
-            self._last['resetdate'] = root[0].attrib['resetdate']
-        elif self._last['type'] == 'error':
-            self._last['message'] = root[0].text
-            self._last['remaining'] = None
-            self._last['resetdate'] = None
+        fields = {'type': root[0].tag.lower(),
+                  'code': root[0].attrib['code'],
+                  'token': None,
+                  'token_url': None,
+                  'apikey': None}
 
-            if (not verify or
-                    (self._last['code'] != '400' and
-                        self._last['code'] != '401')):
-                self._raise_exception()
+        if fields['type'] == 'success':
+            fields['message'] = None
+            fields['remaining'] = root[0].attrib['remaining']
+            fields['resetdate'] = root[0].attrib['resetdate']
+        elif fields['type'] == 'error':
+            fields['message'] = root[0].text
+            fields['remaining'] = None
+            fields['resetdate'] = None
         else:
-            raise exceptions.UnrecognizedResponseError(xmlresp, -1)
+            raise exceptions.UnrecognizedResponseError(response.text, -1)
 
         if len(root) > 1:
             if root[1].tag.lower() == 'retrieve':
                 if 'token' in root[1].attrib:
-                    self._last['token'] = root[1].attrib['token']
-                    self._last['token_url'] = root[1].attrib['url']
-                    self._last['apikey'] = None
+                    fields['token'] = root[1].attrib['token']
+                    fields['token_url'] = root[1].attrib['url']
                 elif 'apikey' in root[1].attrib:
-                    self._last['token'] = None
-                    self._last['token_url'] = None
-                    self._last['apikey'] = root[1].attrib['apikey']
+                    fields['apikey'] = root[1].attrib['apikey']
                 else:
-                    raise exceptions.UnrecognizedResponseError(xmlresp, -1)
+                    raise exceptions.UnrecognizedResponseError(
+                        response.text, -1)
             else:
-                raise exceptions.UnrecognizedResponseError(xmlresp, -1)
+                raise exceptions.UnrecognizedResponseError(response.text, -1)
+
+        parsed = abstract.Response(fields)
+        self._last = parsed
+
+        if parsed['remaining'] is not None:
+            remaining = int(parsed['remaining'])
+            reset_at = float(parsed['resetdate'])
+
+            self._emit('rate_limit', remaining=remaining, reset_at=reset_at)
+            if self.rate_limiter is not None:
+                self.rate_limiter.update(remaining, reset_at)
+        elif parsed['code'] == '406' and self.rate_limiter is not None:
+            self.rate_limiter.exceeded()
+
+        if (parsed['type'] == 'error' and
+                (not verify or
+                    (parsed['code'] != '400' and parsed['code'] != '401'))):
+            self._raise_error(parsed)
+
+        return parsed
+
+    def _parse_xml(self, response):
+
+        try:
+            root = ElementTree.fromstring(response.content)
+            root[0].attrib['code']
+        except (SyntaxError, IndexError, KeyError):
+            # a proxy in front of the server may answer with an HTML page
+
+            self._unparseable(response)
 
         return root
 
-    def _raise_exception(self):
+    def _raise_exception(self, response):
 
-        if self._last['code'] == '400':
-            raise exceptions.FormatError(self._last['message'],
-                                         int(self._last['code']))
-        elif self._last['code'] == '401':
-            if 'provider' not in self._last['message'].lower():
-                raise exceptions.ApiKeyError(self._last['message'],
-                                             int(self._last['code']))
+        if response['code'] == '400':
+            raise exceptions.FormatError(response['message'],
+                                         int(response['code']))
+        elif response['code'] == '401':
+            if 'provider' not in response['message'].lower():
+                raise exceptions.ApiKeyError(response['message'],
+                                             int(response['code']))
             else:
-                raise exceptions.ProviderKeyError(self._last['message'],
-                                                  int(self._last['code']))
-        elif self._last['code'] == '406':
-            raise exceptions.RateLimitExceeded(self._last['message'],
-                                               int(self._last['code']))
-        elif self._last['code'] == '409':
-            raise exceptions.PermissionDenied(self._last['message'],
-                                              int(self._last['code']))
-        elif self._last['code'] == '500':
-            raise exceptions.ServerError(self._last['message'],
-                                         int(self._last['code']))
+                raise exceptions.ProviderKeyError(response['message'],
+                                                  int(response['code']))
+        elif response['code'] == '406':
+            raise exceptions.RateLimitExceeded(response['message'],
+                                               int(response['code']))
+        elif response['code'] == '409':
+            raise exceptions.PermissionDenied(response['message'],
+                                              int(response['code']))
+        elif response['code'] == '500':
+            raise exceptions.ServerError(response['message'],
+                                         int(response['code']))
         else:
-            raise exceptions.UnknownError(self._last['message'],
-                                          int(self._last['code']))
+            raise exceptions.UnknownError(response['message'],
+                                          int(response['code']))
 
-    def notify(self, description, event, split=True, kwargs=None):
+    def notify(self, description, event, split=True, kwargs=None,
+               report=False):
         """Send a notification to each user's apikey in self.apikeys.
 
         Args:
@@ -166,6 +199,9 @@ class Client(abstract.AbstractClient):
                 url: A string of up to 512 characters containing a URL
                     to attach to the notification.
                 (default: None)
+            report: A boolean indicating whether to return a delivery
+                report instead of raising an exception when any
+                delivery fails. (default: False)
 
         Raises:
             pushnotify.exceptions.ApiKeyError
@@ -176,38 +212,23 @@ class Client(abstract.AbstractClient):
             pushnotify.exceptions.UnrecognizedResponseError
 
         Returns:
-            True.
-
-        """
-
-        def send_notify(description, event, kwargs):
-            data = {'apikey': ','.join(self.apikeys),
-                    'application': self.application,
-                    'event': event,
-                    'description': description}
-
-            if self.developerkey:
-                data['providerkey'] = self.developerkey
-
-            if kwargs:
-                data.update(kwargs)
+            True, or a delivery report if report is True. See
+            AbstractClient.notify.
 
-            response = self._post(self._urls['notify'], data)
-            self._parse_response(response)
+        The API keys are sent KEY_LIMIT at a time. If self.workers is
+        greater than 1, the batches are sent concurrently. A failed
+        batch fails for every key in it. When making a delivery report,
+        the keys in a batch rejected for an invalid key are sent to one
+        at a time, to find out which is invalid.
 
-        if not self.apikeys:
-            self.logger.warn('notify called with no users set')
-            return
+        """
 
-        if split:
-            while description:
-                this_desc = description[0:DESC_LIMIT]
-                description = description[DESC_LIMIT:]
-                send_notify(this_desc, event, kwargs)
-        else:
-            send_notify(description, event, kwargs)
+        fields = {'application': self.application, 'event': event}
+        if self.developerkey:
+            fields['providerkey'] = self.developerkey
 
-        return True
+        return self._notify_batches(description, event, split, kwargs,
+                                    report, fields, DESC_LIMIT, KEY_LIMIT)
 
     def retrieve_apikey(self, reg_token):
         """Get a user's API key for a given registration token.
@@ -230,10 +251,10 @@ class Client(abstract.AbstractClient):
         data = {'providerkey': self.developerkey,
                 'token': reg_token}
 
-        response = self._get(self._urls['retrieve_apikey'], data)
-        self._parse_response(response)
+        response = self._parse_response(
+            self._get(self._urls['retrieve_apikey'], data))
 
-        return self._last['apikey']
+        return response['apikey']
 
     def retrieve_token(self):
         """Get a registration token and approval URL.
@@ -254,10 +275,10 @@ class Client(abstract.AbstractClient):
 
         data = {'providerkey': self.developerkey}
 
-        response = self._get(self._urls['retrieve_token'], data)
-        self._parse_response(response)
+        response = self._parse_response(
+            self._get(self._urls['retrieve_token'], data))
 
-        return self._last['token'], self._last['token_url']
+        return response['token'], response['token_url']
 
     def verify_user(self, apikey):
         """Verify a user's API key.
@@ -278,15 +299,28 @@ class Client(abstract.AbstractClient):
 
         """
 
-        data = {'apikey': apikey}
+        def verify():
+            data = {'apikey': apikey}
 
-        if self.developerkey:
-            data['providerkey'] = self.developerkey
+            if self.developerkey:
+                data['providerkey'] = self.developerkey
+
+            response = self._parse_response(
+                self._get(self._urls['verify'], data), True)
+
+            return response['code'] == '200'
+
+        return self._verify_cached(verify, apikey)
 
-        response = self._get(self._urls['verify'], data)
-        self._parse_response(response, True)
 
-        return self._last['code'] == '200'
+class AsyncClient(abstract.AsyncAbstractClient):
+    """Client for sending push notifications to iOS devices with the
+    Prowl application installed, without blocking the caller. See
+    abstract.AsyncAbstractClient.
+
+    """
+
+    client_class = Client
 
 if __name__ == '__main__':
     pass
@@ -26,8 +26,16 @@ information.
 
 
 import time
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        from json import loads as json_loads
 
 from pushnotify import abstract
+from pushnotify import cache
 from pushnotify import exceptions
 
 
@@ -35,9 +43,27 @@ PUBLIC_API_URL = u'https://api.pushover.net/1'
 VERIFY_URL = u'/'.join([PUBLIC_API_URL, u'users/validate.json'])
 NOTIFY_URL = u'/'.join([PUBLIC_API_URL, u'messages.json'])
 SOUND_URL = u'/'.join([PUBLIC_API_URL, u'sounds.json'])
+RECEIPT_URL = u'/'.join([PUBLIC_API_URL, u'receipts/{0}.json'])
+CANCEL_URL = u'/'.join([PUBLIC_API_URL, u'receipts/{0}/cancel.json'])
 
 DESC_LIMIT = 512
 
+# the fields _parse_response copies from a response by default, and
+# always from a failed one, which _raise_exception needs
+
+FIELDS = ('device', 'errors', 'receipt', 'sounds', 'status', 'token',
+          'user')
+
+# the fields get_receipt copies from a receipt's status
+
+RECEIPT_FIELDS = ('acknowledged', 'acknowledged_at', 'acknowledged_by',
+                  'acknowledged_by_device', 'expired', 'expires_at',
+                  'last_delivered_at')
+
+# shared by every client that isn't given a sounds_cache of its own
+
+SOUNDS_CACHE = cache.SoundsCache()
+
 
 class Client(abstract.AbstractClient):
     """Client for sending push notifications to Android and iOS devices
@@ -52,10 +78,15 @@ class Client(abstract.AbstractClient):
         apikeys: A dictionary where the keys are strings containing
             valid user identifier, and the values are lists of strings,
             each containing a valid device identifier.
+        workers: An integer containing the maximum number of
+            user/device combinations notify will send to concurrently.
+        sounds_cache: A pushnotify.cache.SoundsCache used by get_sounds,
+            or None to fetch the sound list every time.
 
     """
 
-    def __init__(self, developerkey, application=''):
+    def __init__(self, developerkey, application='', workers=1,
+                 sounds_cache=SOUNDS_CACHE, **kwargs):
         """Initialize the Pushover client.
 
         Args:
@@ -64,66 +95,102 @@ class Client(abstract.AbstractClient):
             application: A string containing the name of the application
                 on behalf of whom the Pushover client will be sending
                 messages. Not used by this client. (default: '')
+            workers: An integer containing the maximum number of
+                user/device combinations notify will send to
+                concurrently. (default: 1)
+            sounds_cache: A pushnotify.cache.SoundsCache used by
+                get_sounds, or None to not cache the sound list.
+                (default: SOUNDS_CACHE, which all clients share)
+            kwargs: Any other keyword arguments accepted by
+                abstract.AbstractClient, such as session or timeout.
 
         """
 
-        super(self.__class__, self).__init__(developerkey, application)
+        super(self.__class__, self).__init__(developerkey, application,
+                                             workers, **kwargs)
+
+        self.sounds_cache = sounds_cache
 
         self._type = 'pushover'
         self._urls = {'notify': NOTIFY_URL,
                       'verify': VERIFY_URL,
-                      'sounds': SOUND_URL}
+                      'sounds': SOUND_URL,
+                      'receipt': RECEIPT_URL,
+                      'cancel': CANCEL_URL}
+
+    def _parse_response(self, stream, verify=False, fields=FIELDS):
+
+        # Pushover always sends UTF-8 JSON, so decode the bytes with the
+        # fastest JSON module installed, skipping requests' detection of
+        # the encoding
 
-    def _parse_response(self, stream, verify=False):
+        try:
+            data = json_loads(stream.content)
+        except ValueError:
+            # a proxy in front of Pushover may answer with an HTML page
 
-        response = stream.json()
-        self.logger.info('received response: {0}'.format(response))
+            if stream.status_code < 500:
+                self._unparseable(stream)
+            data = {'errors': ['HTTP {0} with an unrecognized body'.format(
+                stream.status_code)]}
 
-        self._last['code'] = stream.status_code
-        self._last['device'] = response.get('device', None)
-        self._last['errors'] = response.get('errors', None)
-        self._last['status'] = response.get('status', None)
-        self._last['token'] = response.get('token', None)
-        self._last['user'] = response.get('user', None)
-        self._last['sounds'] = response.get('sounds', None)
-        self._last['receipt'] = response.get('receipt', None)
+        self.logger.info('received response: %s', self._loggable(data))
 
-        return self._last['status']
+        status = data.get('status')
+        if status != 1:
+            fields = FIELDS
 
-    def _raise_exception(self):
+        response = abstract.Response(
+            ((field, data.get(field)) for field in fields),
+            code=stream.status_code, status=status)
+
+        self._last = response
+
+        # Pushover reports the application's monthly limit in headers
+
+        remaining = stream.headers.get('X-Limit-App-Remaining')
+        if remaining is not None:
+            self._emit('rate_limit', remaining=int(remaining),
+                       reset_at=float(stream.headers.get(
+                           'X-Limit-App-Reset', 0)))
+
+        return response
+
+    def _raise_exception(self, response):
 
         msg = ''
-        if self._last['errors']:
+        if response['errors']:
             messages = []
-            for error in self._last['errors']:
+            for error in response['errors']:
                 messages.append(error)
             msg = '; '.join(messages)
 
-        if self._last['device'] and 'invalid' in self._last['device']:
-            raise exceptions.ApiKeyError('device invalid', self._last['code'])
+        if response['device'] and 'invalid' in response['device']:
+            raise exceptions.ApiKeyError('device invalid', response['code'])
 
-        elif self._last['token'] and 'invalid' in self._last['token']:
-            raise exceptions.ApiKeyError('token invalid', self._last['code'])
+        elif response['token'] and 'invalid' in response['token']:
+            raise exceptions.ApiKeyError('token invalid', response['code'])
 
-        elif self._last['user'] and 'invalid' in self._last['user']:
-            raise exceptions.ApiKeyError('user invalid', self._last['code'])
+        elif response['user'] and 'invalid' in response['user']:
+            raise exceptions.ApiKeyError('user invalid', response['code'])
 
-        elif self._last['code'] == 429:
+        elif response['code'] == 429:
             # TODO: what is actually returned when the rate limit is hit?
 
             msg = 'too many messages sent this month' if not msg else msg
-            raise exceptions.RateLimitExceeded(msg, self._last['code'])
+            raise exceptions.RateLimitExceeded(msg, response['code'])
 
-        elif self._last['code'] >= 500 and self._last['code'] <= 599:
-            raise exceptions.ServerError(msg, self._last['code'])
+        elif response['code'] >= 500 and response['code'] <= 599:
+            raise exceptions.ServerError(msg, response['code'])
 
-        elif self._last['errors']:
-            raise exceptions.FormatError(msg, self._last['code'])
+        elif response['errors']:
+            raise exceptions.FormatError(msg, response['code'])
 
         else:
-            raise exceptions.UnrecognizedResponseError(msg, self._last['code'])
+            raise exceptions.UnrecognizedResponseError(msg, response['code'])
 
-    def notify(self, description, event, split=True, kwargs=None):
+    def notify(self, description, event, split=True, kwargs=None,
+               report=False):
         """Send a notification to each user/device combintation in
         self.apikeys.
 
@@ -157,6 +224,9 @@ class Client(abstract.AbstractClient):
                 sound: A string containing a valid sound returned from
                     get_sounds().
                 (default: None)
+            report: A boolean indicating whether to return a delivery
+                report instead of raising an exception when any
+                delivery fails. (default: False)
 
         Raises:
             pushnotify.exceptions.ApiKeyError
@@ -167,65 +237,110 @@ class Client(abstract.AbstractClient):
 
         Returns:
             A string containing the last receipt received, if priority
-            was sent to 2, otherwise True.
+            was sent to 2, otherwise True. If report is True, a delivery
+            report instead, which has every receipt received. See
+            AbstractClient.notify, and pushnotify.receipts for tracking
+            the receipts until they are acknowledged.
+
+        If self.workers is greater than 1, the user/device combinations
+        are sent to concurrently over the client's shared session.
 
         """
 
-        def send_notify(desc_list, event, kwargs, apikey, device_key=''):
-            all_successful = True
+        def send_chunk(data):
+            response = self._parse_response(
+                self._post(self._urls['notify'], data), fields=('receipt',))
+
+            if response['code'] >= 500 and response['code'] <= 599:
+                self._raise_error(response)
+
+            return response
 
-            for description in desc_list:
-                data = {'token': self.developerkey,
-                        'user': apikey,
-                        'title': event,
-                        'message': description,
-                        'timestamp': int(time.time())}
+        def send_notify(delivery):
+            apikey, device_key = delivery
+            failure = None
+            last = abstract.Response()
+            records = []
 
-                if device_key:
-                    data['device'] = device_key
+            for chunk, description in enumerate(desc_list):
+                data = template.render(user=apikey,
+                                       device=device_key or None,
+                                       message=description,
+                                       timestamp=int(time.time()))
 
-                if kwargs:
-                    data.update(kwargs)
+                start = time.time()
+                error = None
 
-                response = self._post(self._urls['notify'], data)
-                this_successful = self._parse_response(response)
+                try:
+                    last = self._retry(send_chunk, data)
+                except exceptions.ServerError as exc:
+                    last, error = self._last, exc
+                except abstract.DELIVERY_ERRORS as exc:
+                    last, error = abstract.Response(), exc
 
-                all_successful = all_successful and this_successful
+                if error is None and last.get('status') != 1:
+                    try:
+                        self._raise_error(last)
+                    except exceptions.PushNotifyError as exc:
+                        error = exc
 
-            return all_successful
+                if error is not None:
+                    self.logger.warning(
+                        'notify failed for 1 of %d users and devices: %r',
+                        len(deliveries), error)
+                    failure = failure or error
+
+                if report:
+                    records.append(self._delivery(
+                        apikey, device_key or None, chunk, start,
+                        last.get('status') == 1, last, error))
+
+            return failure, last, records
 
         if not self.apikeys:
             self.logger.warn('notify called with no users set')
             return
 
-        desc_list = []
-        if split:
-            while description:
-                desc_list.append(description[0:DESC_LIMIT])
-                description = description[DESC_LIMIT:]
-        else:
-            desc_list = [description]
+        desc_list = self._split(description, DESC_LIMIT, split)
+
+        deliveries, earlier = self._dedup(
+            abstract.expand_apikeys(self.apikeys), description, event,
+            kwargs)
+        if not deliveries:
+            return [] if report else earlier[-1]
+
+        self._emit('notify', recipients=len(deliveries),
+                   chunks=len(desc_list))
 
-        # Here we match the behavior of Notify My Android and Prowl:
-        # raise a single exception if and only if every notification
-        # fails
+        # only the user, device, message and timestamp vary between
+        # requests, so encode the rest of the form once
 
-        all_ok = True
+        fields = {'token': self.developerkey, 'title': event}
+        if kwargs:
+            fields.update(kwargs)
+        template = abstract.FormTemplate(fields)
 
-        for apikey, device_keys in self.apikeys.items():
-            if not device_keys:
-                this_ok = send_notify(desc_list, event, kwargs, apikey)
-            else:
-                for device_key in device_keys:
-                    this_ok = send_notify(
-                        desc_list, event, kwargs, apikey, device_key)
+        results = self._map(send_notify, deliveries)
 
-            all_ok = all_ok and this_ok
+        self._dedup_add([(delivery, response.get('receipt') or True)
+                         for delivery, (failure, response, records)
+                         in zip(deliveries, results) if failure is None],
+                        description, event, kwargs)
 
-        if not all_ok:
-            self._raise_exception()
+        if report:
+            return [record for failure, response, records in results
+                    for record in records]
 
-        return self._last['receipt'] if self._last['receipt'] else True
+        last = results[-1][1]
+        self._last = last
+
+        # see AbstractClient.notify
+
+        for failure, response, records in results:
+            if failure is not None:
+                raise failure
+
+        return last.get('receipt') or True
 
     def verify_user(self, apikey):
         """Verify a user identifier.
@@ -239,13 +354,15 @@ class Client(abstract.AbstractClient):
 
         """
 
-        data = {'token': self.developerkey, 'user': apikey}
+        def verify():
+            data = {'token': self.developerkey, 'user': apikey}
 
-        response = self._post(self._urls['verify'], data)
+            response = self._parse_response(
+                self._post(self._urls['verify'], data), True, ())
 
-        self._parse_response(response, True)
+            return response['status']
 
-        return self._last['status']
+        return self._verify_cached(verify, apikey)
 
     def verify_device(self, apikey, device_key):
         """Verify a device identifier for the user given by apikey.
@@ -263,29 +380,138 @@ class Client(abstract.AbstractClient):
 
         """
 
-        data = {'token': self.developerkey, 'user': apikey,
-                'device': device_key}
+        def verify():
+            data = {'token': self.developerkey, 'user': apikey,
+                    'device': device_key}
+
+            response = self._parse_response(
+                self._post(self._urls['verify'], data), True, ('user',))
+
+            if response['user'] and 'invalid' in response['user'].lower():
+                self._raise_error(response)
+
+            return response['status']
+
+        return self._verify_cached(verify, apikey, device_key)
+
+    def get_receipt(self, receipt):
+        """Get the status of an emergency priority notification.
+
+        Args:
+            receipt: A string containing the receipt returned by notify.
+
+        Raises:
+            pushnotify.exceptions.ApiKeyError
+            pushnotify.exceptions.FormatError: if the receipt is unknown.
+            pushnotify.exceptions.ServerError
+
+        Returns:
+            A pushnotify.abstract.Response with the following fields:
+                acknowledged: An integer containing 1 if a user has
+                    acknowledged the notification, and 0 if not.
+                acknowledged_at: An integer containing the time it was
+                    acknowledged, in seconds since the epoch, or 0.
+                acknowledged_by: A string containing the user key of
+                    the user who acknowledged it.
+                acknowledged_by_device: A string containing the name of
+                    the device it was acknowledged on.
+                expired: An integer containing 1 if the server has
+                    stopped resending it, and 0 if not.
+                expires_at: An integer containing the time the server
+                    stops resending it, in seconds since the epoch.
+                last_delivered_at: An integer containing the time it
+                    was last sent, in seconds since the epoch.
+            (see: https://pushover.net/api/receipts)
+
+        """
+
+        response = self._parse_response(
+            self._get(self._urls['receipt'].format(receipt),
+                      {'token': self.developerkey}),
+            fields=RECEIPT_FIELDS)
+
+        if response['status'] != 1:
+            self._raise_error(response)
+
+        return response
+
+    def cancel_receipt(self, receipt):
+        """Stop resending an emergency priority notification that
+        hasn't been acknowledged yet.
+
+        Args:
+            receipt: A string containing the receipt returned by notify.
+
+        Raises:
+            pushnotify.exceptions.ApiKeyError
+            pushnotify.exceptions.FormatError: if the receipt is unknown.
+            pushnotify.exceptions.ServerError
+
+        Returns:
+            True
 
-        response = self._post(self._urls['verify'], data)
+        """
 
-        self._parse_response(response, True)
+        response = self._parse_response(
+            self._post(self._urls['cancel'].format(receipt),
+                       {'token': self.developerkey}), fields=())
 
-        if self._last['user'] and 'invalid' in self._last['user'].lower():
-            self._raise_exception()
+        if response['status'] != 1:
+            self._raise_error(response)
 
-        return self._last['status']
+        return True
 
     def get_sounds(self):
         """ Retrieve available sounds list.
 
+        The list is kept in self.sounds_cache, if set, and only fetched
+        again once the cache's TTL has passed and the server says it
+        has changed.
+
         Returns:
             A dictionary with each key being the actual sound parameter to store for the user
             and send to Pushover, with its value describing the sound.
         """
-        response = self._get(self._urls['sounds'],
-                             {'token': self.developerkey})
-        self._parse_response(response, True)
-        return self._last['sounds']
+
+        entry = None
+        headers = {}
+
+        if self.sounds_cache is not None:
+            entry = self.sounds_cache.get(self.developerkey)
+
+            if entry is not None:
+                if entry['fresh']:
+                    return entry['sounds']
+                if entry['etag']:
+                    headers['If-None-Match'] = entry['etag']
+                if entry['last_modified']:
+                    headers['If-Modified-Since'] = entry['last_modified']
+
+        stream = self._get(self._urls['sounds'],
+                           {'token': self.developerkey}, headers or None)
+
+        if entry is not None and stream.status_code == 304:
+            self.sounds_cache.touch(self.developerkey)
+            return entry['sounds']
+
+        response = self._parse_response(stream, True, ('sounds',))
+
+        if self.sounds_cache is not None and response['sounds']:
+            self.sounds_cache.set(self.developerkey, response['sounds'],
+                                  stream.headers.get('ETag'),
+                                  stream.headers.get('Last-Modified'))
+
+        return response['sounds']
+
+
+class AsyncClient(abstract.AsyncAbstractClient):
+    """Client for sending push notifications to Android and iOS devices
+    with the Pushover application installed, without blocking the
+    caller. See abstract.AsyncAbstractClient.
+
+    """
+
+    client_class = Client
 
 if __name__ == '__main__':
     pass
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module for pacing requests to stay within a notification server's
+rate limit.
+
+"""
+
+import threading
+import time
+
+from pushnotify import exceptions
+
+
+class RateLimiter(object):
+    """A token bucket that learns its rate from the notification
+    server's responses.
+
+    Each response that reports how many calls remain and when the limit
+    resets refills the bucket at a rate that spreads those calls evenly
+    until the reset. Until the first such response, and after each
+    reset, calls aren't paced at all. One RateLimiter may be shared by
+    several clients using the same API keys.
+
+    Member Vars:
+        burst: An integer containing the number of calls that may be
+            sent back to back before pacing starts.
+        max_wait: A float containing the most seconds acquire will wait
+            before raising pushnotify.exceptions.RateLimitExceeded
+            instead, or None to wait as long as it takes.
+        backoff: A float containing the number of seconds to stop
+            sending for after the server says the limit was exceeded,
+            if it didn't say when the limit resets.
+
+    """
+
+    def __init__(self, burst=10, max_wait=None, backoff=60.0,
+                 clock=time.time, sleep=time.sleep):
+        """Initialize the rate limiter.
+
+        Args:
+            burst: An integer containing the number of calls that may
+                be sent back to back before pacing starts. (default: 10)
+            max_wait: A float containing the most seconds acquire will
+                wait, or None to wait as long as it takes.
+                (default: None)
+            backoff: A float containing the number of seconds to stop
+                sending for after the limit is exceeded, if the reset
+                time isn't known. (default: 60.0)
+            clock: A function returning the current time in seconds.
+                (default: time.time)
+            sleep: A function that sleeps for the given number of
+                seconds. (default: time.sleep)
+
+        """
+
+        self.burst = burst
+        self.max_wait = max_wait
+        self.backoff = backoff
+
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+        self._clear()
+
+    def _clear(self):
+
+        self._rate = None
+        self._remaining = None
+        self._reset_at = None
+        self._tokens = float(self.burst)
+        self._updated = None
+
+    def _refill(self, now):
+
+        if self._updated is not None and self._rate is not None:
+            self._tokens = min(float(self.burst),
+                               self._tokens +
+                               (now - self._updated) * self._rate)
+        self._updated = now
+
+    @property
+    def remaining(self):
+        """An integer containing the number of calls left before the
+        limit resets, or None if it isn't known.
+
+        """
+
+        return self._remaining
+
+    @property
+    def reset_at(self):
+        """A float containing the time when the limit resets, in seconds
+        since the epoch, or None if it isn't known.
+
+        """
+
+        return self._reset_at
+
+    def acquire(self):
+        """Wait until another call may be sent within the limit.
+
+        Raises:
+            pushnotify.exceptions.RateLimitExceeded: if that would take
+                longer than max_wait.
+
+        Returns:
+            A float containing the number of seconds waited.
+
+        """
+
+        with self._lock:
+            now = self._clock()
+
+            if self._reset_at is not None and now >= self._reset_at:
+                self._clear()
+
+            if self._rate is None and self._remaining is None:
+                return 0.0
+
+            self._refill(now)
+
+            if self._remaining <= 0:
+                wait = self._reset_at - now
+            elif self._tokens >= 1:
+                wait = 0.0
+            else:
+                wait = (1 - self._tokens) / self._rate
+
+            if self.max_wait is not None and wait > self.max_wait:
+                raise exceptions.RateLimitExceeded(
+                    'rate limit would be exceeded for {0:.1f} more '
+                    'seconds'.format(wait), -1)
+
+            if self._remaining > 0:
+                self._tokens -= 1
+                self._remaining -= 1
+
+        if wait > 0:
+            self._sleep(wait)
+
+        return wait
+
+    def exceeded(self, reset_at=None):
+        """Record that the server refused a call for exceeding the
+        limit, so that no more are sent until it resets.
+
+        Args:
+            reset_at: A float containing the time when the limit resets,
+                in seconds since the epoch. If None, the last known
+                reset time is used, or backoff seconds from now.
+                (default: None)
+
+        """
+
+        with self._lock:
+            now = self._clock()
+
+            if reset_at is None:
+                if self._reset_at is not None and self._reset_at > now:
+                    reset_at = self._reset_at
+                else:
+                    reset_at = now + self.backoff
+
+            self._remaining = 0
+            self._reset_at = reset_at
+            self._updated = now
+
+    def update(self, remaining, reset_at):
+        """Learn the limit from a server response.
+
+        Args:
+            remaining: An integer containing the number of calls left
+                before the limit resets.
+            reset_at: A float containing the time when the limit resets,
+                in seconds since the epoch.
+
+        """
+
+        with self._lock:
+            now = self._clock()
+
+            if self._rate is None:
+                self._tokens = float(self.burst)
+            self._refill(now)
+
+            self._remaining = remaining
+            self._reset_at = reset_at
+            self._rate = float(remaining) / max(reset_at - now, 1.0)
+
+
+if __name__ == '__main__':
+    pass
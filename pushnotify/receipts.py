@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module for following emergency priority Pushover notifications until
+they are acknowledged or expire.
+
+"""
+
+import logging
+import threading
+import time
+
+from pushnotify import abstract
+from pushnotify import exceptions
+
+
+class ReceiptTracker(object):
+    """Polls the receipts of emergency priority Pushover notifications
+    and calls back once each is acknowledged or expires.
+
+    Pushover can only look up one receipt per request, so each call to
+    poll looks up every receipt that is due at once, using up to
+    client.workers threads. A receipt is polled every min_interval
+    seconds at first, backing off towards max_interval while nothing
+    changes. It goes back to min_interval each time the server resends
+    the notification, since that is when users tend to respond, and is
+    always polled as soon as it expires.
+
+    To try it against a local mock of the Pushover API, give the client
+    an adapter, or a session, that answers its requests.
+
+    Member Vars:
+        client: The pushover.Client used to send notifications and look
+            up their receipts.
+        on_acknowledge: A function called with the receipt and the
+            pushnotify.abstract.Response from pushover.Client.get_receipt
+            when a receipt is acknowledged, or None.
+        on_expire: A function called the same way when a receipt expires
+            without being acknowledged, or None.
+        min_interval: A float containing the fewest seconds between two
+            polls of one receipt.
+        max_interval: A float containing the most seconds between two
+            polls of one receipt.
+
+    """
+
+    def __init__(self, client, on_acknowledge=None, on_expire=None,
+                 min_interval=5.0, max_interval=60.0, clock=time.time,
+                 sleep=time.sleep):
+        """Initialize the receipt tracker.
+
+        Args:
+            client: The pushover.Client to use.
+            on_acknowledge: A function taking a receipt and its status,
+                called when it is acknowledged. (default: None)
+            on_expire: A function taking a receipt and its status,
+                called when it expires. (default: None)
+            min_interval: A float containing the fewest seconds between
+                two polls of one receipt. Pushover asks for no less than
+                5. (default: 5.0)
+            max_interval: A float containing the most seconds between
+                two polls of one receipt. (default: 60.0)
+            clock: A function returning the current time in seconds.
+                (default: time.time)
+            sleep: A function that sleeps for the given number of
+                seconds, used by wait. (default: time.sleep)
+
+        """
+
+        self.logger = logging.getLogger('{0}.{1}'.format(
+            self.__module__, self.__class__.__name__))
+
+        self.client = client
+        self.on_acknowledge = on_acknowledge
+        self.on_expire = on_expire
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._receipts = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _call(self, callback, receipt, status):
+
+        if callback is None:
+            return
+
+        try:
+            callback(receipt, status)
+        except Exception:
+            self.logger.exception('callback for receipt %s failed', receipt)
+
+    def _due(self):
+        """Get the seconds until the next receipt is due, or None if
+        none are tracked.
+
+        """
+
+        with self._lock:
+            if not self._receipts:
+                return None
+            next_poll = min(entry['next_poll']
+                            for entry in self._receipts.values())
+
+        return max(next_poll - self._clock(), 0.0)
+
+    def _lookup(self, receipt):
+
+        try:
+            return self.client.get_receipt(receipt), None
+        except abstract.DELIVERY_ERRORS as exc:
+            return None, exc
+
+    def _run(self):
+
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                self.logger.exception('poll failed')
+
+            due = self._due()
+            self._stop.wait(self.min_interval if due is None else
+                            max(due, 0.1))
+
+    def _schedule(self, entry, now, interval):
+
+        entry['interval'] = interval
+        entry['next_poll'] = now + interval
+
+        expires_at = entry['expires_at']
+        if expires_at is not None and now < expires_at < entry['next_poll']:
+            entry['next_poll'] = expires_at
+
+    def cancel(self, receipt):
+        """Stop the server resending a notification and stop tracking
+        its receipt. Neither callback is called for it.
+
+        Args:
+            receipt: A string containing the receipt.
+
+        Raises:
+            pushnotify.exceptions.ApiKeyError
+            pushnotify.exceptions.FormatError
+            pushnotify.exceptions.ServerError
+
+        """
+
+        self.client.cancel_receipt(receipt)
+        self.untrack(receipt)
+
+    def close(self):
+        """Stop the background thread, if running, leaving every receipt
+        tracked.
+
+        """
+
+        self.stop()
+
+    def notify(self, description, event, split=True, kwargs=None,
+               on_acknowledge=None, on_expire=None):
+        """Send an emergency priority notification through the client and
+        track every receipt it returns, one for each user and device and
+        each part of a split description.
+
+        Args:
+            description, event, split: See pushover.Client.notify.
+            kwargs: See pushover.Client.notify. priority defaults to 2,
+                and retry and expire must be given. (default: None)
+            on_acknowledge: A function overriding self.on_acknowledge
+                for these receipts. (default: None)
+            on_expire: A function overriding self.on_expire for these
+                receipts. (default: None)
+
+        Raises:
+            The error the last delivery failed with, if every delivery
+            failed. See pushover.Client.notify.
+
+        Returns:
+            A list of strings containing the receipts, which is empty if
+            the client has no keys.
+
+        """
+
+        kwargs = dict(kwargs or {})
+        kwargs.setdefault('priority', 2)
+
+        # notify returns None when the client has no keys
+
+        report = self.client.notify(description, event, split, kwargs,
+                                    report=True) or []
+
+        if report and not any(record['status'] for record in report):
+            raise report[-1]['error']
+
+        expires_at = None
+        if 'expire' in kwargs:
+            expires_at = self._clock() + int(kwargs['expire'])
+
+        receipts = [record['receipt'] for record in report
+                    if record['receipt']]
+        for receipt in receipts:
+            self.track(receipt, on_acknowledge, on_expire, expires_at)
+
+        return receipts
+
+    def pending(self):
+        """Get the receipts that haven't been acknowledged or expired
+        yet.
+
+        Returns:
+            A list of strings.
+
+        """
+
+        with self._lock:
+            return sorted(self._receipts)
+
+    def poll(self):
+        """Look up every receipt that is due and call back for those
+        that were acknowledged or expired.
+
+        Returns:
+            An integer containing the number of receipts looked up.
+
+        """
+
+        now = self._clock()
+
+        with self._lock:
+            due = [receipt for receipt, entry in self._receipts.items()
+                   if entry['next_poll'] <= now]
+
+        if not due:
+            return 0
+
+        results = self.client._map(self._lookup, due)
+        now = self._clock()
+        finished = []
+
+        with self._lock:
+            for receipt, (status, error) in zip(due, results):
+                entry = self._receipts.get(receipt)
+                if entry is None:
+                    continue
+
+                if error is not None:
+                    if isinstance(error, exceptions.FormatError):
+                        self.logger.warning('dropping receipt %s: %r',
+                                            receipt, error)
+                        del self._receipts[receipt]
+                        continue
+
+                    self.logger.info('looking up receipt %s failed: %r',
+                                     receipt, error)
+                    self._schedule(entry, now, min(
+                        entry['interval'] * 2, self.max_interval))
+                    continue
+
+                if status['acknowledged']:
+                    finished.append((entry['on_acknowledge'], receipt,
+                                     status))
+                    del self._receipts[receipt]
+                    continue
+
+                if status['expired']:
+                    finished.append((entry['on_expire'], receipt, status))
+                    del self._receipts[receipt]
+                    continue
+
+                if status['expires_at']:
+                    entry['expires_at'] = float(status['expires_at'])
+
+                if status['last_delivered_at'] != entry['last_delivered']:
+                    entry['last_delivered'] = status['last_delivered_at']
+                    interval = self.min_interval
+                elif (entry['expires_at'] is not None and
+                      now >= entry['expires_at']):
+                    interval = self.min_interval
+                else:
+                    interval = min(entry['interval'] * 2, self.max_interval)
+
+                self._schedule(entry, now, interval)
+
+        for callback, receipt, status in finished:
+            self._call(callback, receipt, status)
+
+        return len(due)
+
+    def start(self):
+        """Start polling in a background thread.
+
+        """
+
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='pushnotify-receipts')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the background thread once it finishes polling, if it
+        is.
+
+        Args:
+            timeout: A float containing the most seconds to wait for it,
+                or None to wait as long as it takes. (default: None)
+
+        """
+
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def track(self, receipt, on_acknowledge=None, on_expire=None,
+              expires_at=None):
+        """Start tracking a receipt. It is first polled after
+        min_interval seconds.
+
+        Args:
+            receipt: A string containing a receipt returned by
+                pushover.Client.notify.
+            on_acknowledge: A function overriding self.on_acknowledge
+                for this receipt. (default: None)
+            on_expire: A function overriding self.on_expire for this
+                receipt. (default: None)
+            expires_at: A float containing the time the notification
+                expires, in seconds since the epoch, if known.
+                (default: None)
+
+        """
+
+        entry = {'on_acknowledge': on_acknowledge or self.on_acknowledge,
+                 'on_expire': on_expire or self.on_expire,
+                 'expires_at': expires_at,
+                 'last_delivered': None}
+        self._schedule(entry, self._clock(), self.min_interval)
+
+        with self._lock:
+            self._receipts[receipt] = entry
+
+    def untrack(self, receipt):
+        """Stop tracking a receipt, without cancelling it.
+
+        Args:
+            receipt: A string containing the receipt.
+
+        """
+
+        with self._lock:
+            self._receipts.pop(receipt, None)
+
+    def wait(self, timeout=None):
+        """Poll in the calling thread until every receipt has been
+        acknowledged or has expired.
+
+        Args:
+            timeout: A float containing the most seconds to wait, or
+                None to wait as long as it takes. (default: None)
+
+        Returns:
+            A boolean containing True if no receipts are left, and False
+            if the timeout passed first.
+
+        """
+
+        deadline = None if timeout is None else self._clock() + timeout
+
+        while True:
+            self.poll()
+
+            due = self._due()
+            if due is None:
+                return True
+
+            if deadline is not None:
+                left = deadline - self._clock()
+                if left <= 0:
+                    return False
+                due = min(due, left)
+
+            self._sleep(due)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Jeffrey Goettsch and other contributors.
+#
+# This file is part of py-pushnotify.
+#
+# py-pushnotify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# py-pushnotify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with py-pushnotify.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module for retrying requests that failed for temporary reasons.
+
+"""
+
+import logging
+import random
+import time
+
+import requests
+
+from pushnotify import exceptions
+
+
+RETRYABLE = (exceptions.ServerError,
+             requests.exceptions.ConnectionError,
+             requests.exceptions.Timeout)
+
+
+class RetryPolicy(object):
+    """A policy for retrying a failed request with exponential backoff.
+
+    Member Vars:
+        max_attempts: An integer containing the most times a request is
+            tried, including the first.
+        backoff_base: A float containing the number of seconds to wait
+            before the first retry. It doubles for each retry after.
+        backoff_cap: A float containing the most seconds to wait before
+            any retry.
+        jitter: A boolean indicating whether to wait a random time of up
+            to the backoff (True), so that many clients failing at once
+            don't all retry at once, or exactly the backoff (False).
+        retry_on: A tuple of the exception classes that are retried.
+            Anything else is raised right away.
+
+    """
+
+    def __init__(self, max_attempts=3, backoff_base=0.5, backoff_cap=30.0,
+                 jitter=True, retry_on=RETRYABLE, sleep=time.sleep):
+        """Initialize the retry policy.
+
+        Args:
+            max_attempts: An integer containing the most times a request
+                is tried, including the first. (default: 3)
+            backoff_base: A float containing the number of seconds to
+                wait before the first retry. (default: 0.5)
+            backoff_cap: A float containing the most seconds to wait
+                before any retry. (default: 30.0)
+            jitter: A boolean indicating whether to randomize the wait.
+                (default: True)
+            retry_on: A tuple of the exception classes that are retried.
+                (default: pushnotify.exceptions.ServerError and the
+                connection and timeout errors from requests)
+            sleep: A function that sleeps for the given number of
+                seconds. (default: time.sleep)
+
+        """
+
+        self.logger = logging.getLogger('{0}.{1}'.format(
+            self.__module__, self.__class__.__name__))
+
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.jitter = jitter
+        self.retry_on = tuple(retry_on)
+
+        self._sleep = sleep
+
+    def backoff(self, attempt):
+        """Get the number of seconds to wait after a failed attempt.
+
+        Args:
+            attempt: An integer containing the number of the attempt
+                that failed, starting at 1.
+
+        Returns:
+            A float.
+
+        """
+
+        backoff = min(self.backoff_cap,
+                      self.backoff_base * 2 ** (attempt - 1))
+
+        if self.jitter:
+            backoff = random.uniform(0, backoff)
+
+        return backoff
+
+    def call(self, func, *args, **kwargs):
+        """Call func with the given arguments, retrying it as long as it
+        raises a retryable exception and attempts remain.
+
+        Raises:
+            The last exception raised by func, once it can't be retried.
+
+        Returns:
+            Whatever func returns.
+
+        """
+
+        attempt = 1
+
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except self.retry_on as exc:
+                if attempt >= self.max_attempts:
+                    raise
+
+                backoff = self.backoff(attempt)
+                self.logger.info(
+                    'attempt %d of %d failed (%r), retrying in %.2f seconds',
+                    attempt, self.max_attempts, exc, backoff)
+
+                self._sleep(backoff)
+                attempt += 1
+
+
+if __name__ == '__main__':
+    pass
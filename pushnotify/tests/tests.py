@@ -24,15 +24,39 @@
 
 
 import imp
+import json
+import logging
 import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+try:
+    from urlparse import parse_qsl
+except ImportError:
+    from urllib.parse import parse_qsl
+
+import requests
 
 from pushnotify import abstract
+from pushnotify import aggregate
+from pushnotify import cache
 from pushnotify import get_client
 from pushnotify import exceptions
+from pushnotify import metrics
+from pushnotify import multi
 from pushnotify import nma
+from pushnotify import outbox
+from pushnotify import processes
 from pushnotify import prowl
 from pushnotify import pushover
+from pushnotify import ratelimit
+from pushnotify import receipts
+from pushnotify import retry
 
 try:
     imp.find_module('nmakeys', [os.path.dirname(__file__)])
@@ -63,6 +87,116 @@ else:
     from pushnotify.tests.pushoverkeys import USER as PUSHOVER_USER
 
 
+class FakeResponse(object):
+    """A stand-in for requests.Response.
+
+    """
+
+    def __init__(self, text, status_code=200, headers=None):
+
+        self.text = text
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    @property
+    def content(self):
+
+        return self.text.encode('utf-8')
+
+    def json(self):
+
+        return json.loads(self.text)
+
+
+class FakeSession(object):
+    """A stand-in for requests.Session that answers every request by
+    calling handler(method, url, data) and records what was sent. Form
+    encoded bodies are decoded into dictionaries first.
+
+    """
+
+    def __init__(self, handler):
+
+        self.handler = handler
+        self.requests = []
+        self.headers = []
+        self.timeouts = []
+        self._lock = threading.Lock()
+
+    def _request(self, method, url, data, headers, timeout):
+
+        if isinstance(data, (bytes, str)):
+            data = dict(parse_qsl(data))
+
+        with self._lock:
+            self.requests.append((method, url, data))
+            self.headers.append(headers)
+            self.timeouts.append(timeout)
+
+        return self.handler(method, url, data)
+
+    def get(self, url, params=None, headers=None, timeout=None):
+
+        return self._request('GET', url, params, headers, timeout)
+
+    def post(self, url, data=None, headers=None, timeout=None):
+
+        return self._request('POST', url, data, headers, timeout)
+
+
+def pushover_handler(method, url, data):
+    """Answer like Pushover, treating users starting with '_' as
+    invalid.
+
+    """
+
+    if data.get('user', '').startswith('_'):
+        return FakeResponse(json.dumps({'status': 0, 'user': 'invalid',
+                                        'errors': ['user key is invalid']}),
+                            400)
+
+    return FakeResponse(json.dumps({'status': 1, 'receipt': None}))
+
+
+def prowl_handler(method, url, data):
+    """Answer like Prowl or NMA, treating API keys starting with '_' as
+    invalid.
+
+    """
+
+    if any(key.startswith('_') for key in data['apikey'].split(',')):
+        return FakeResponse('<?xml version="1.0" encoding="UTF-8"?>'
+                            '<prowl><error code="401">Invalid API key'
+                            '</error></prowl>')
+
+    return FakeResponse('<?xml version="1.0" encoding="UTF-8"?>'
+                        '<prowl><success code="200" remaining="999" '
+                        'resetdate="1234567890" resettimer="60" />'
+                        '</prowl>')
+
+
+def flaky(handler, failures):
+    """Wrap handler so that it answers the first failures requests for
+    each user with a server error.
+
+    """
+
+    counts = {}
+
+    def flaky_handler(method, url, data):
+        key = data.get('user', data.get('apikey'))
+        counts[key] = counts.get(key, 0) + 1
+        if counts[key] <= failures:
+            return FakeResponse(
+                '<?xml version="1.0" encoding="UTF-8"?><prowl>'
+                '<error code="500">Internal error</error></prowl>'
+                if 'apikey' in data else
+                json.dumps({'status': 0, 'errors': ['oops']}), 500)
+        return handler(method, url, data)
+
+    return flaky_handler
+
+
 class PushnotifyTest(unittest.TestCase):
 
     def setUp(self):
@@ -98,6 +232,22 @@ class PushnotifyTest(unittest.TestCase):
         self.assertTrue(client._type == 'pushover')
         self.assertTrue(isinstance(client, pushover.Client))
 
+    def test_lazy_import(self):
+        """Test that importing pushnotify and its exceptions doesn't
+        import the clients or requests.
+
+        """
+
+        code = ('import sys\n'
+                'from pushnotify import exceptions\n'
+                'sys.exit(\'requests\' in sys.modules or '
+                '\'pushnotify.nma\' in sys.modules)')
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+
+        self.assertEqual(
+            subprocess.call([sys.executable, '-c', code], cwd=root), 0)
+
 
 class AbstractClientTest(unittest.TestCase):
     """Test the AbstractClient class.
@@ -152,6 +302,80 @@ class AbstractClientTest(unittest.TestCase):
         self.client.del_key(apikey, device_key)
         self.assertTrue(device_key not in self.client.apikeys[apikey])
 
+    def test_session_options(self):
+        """Test the connection pool, adapter and timeout options.
+
+        """
+
+        client = abstract.AbstractClient(workers=32)
+        adapter = client._browser.get_adapter(pushover.PUBLIC_API_URL)
+        self.assertEqual(adapter._pool_maxsize, 32)
+
+        session = abstract.make_session(pool_maxsize=4)
+        client = get_client('prowl', session=session, timeout=(3.05, 27))
+        other = get_client('nma', session=session)
+        self.assertTrue(client._browser is other._browser)
+        self.assertEqual(client.timeout, (3.05, 27))
+
+        client._browser = FakeSession(prowl_handler)
+        client.verify_user('good')
+        self.assertEqual(client._browser.timeouts, [(3.05, 27)])
+
+    def test_redact_logs(self):
+        """Test masking keys and tokens in logged requests and
+        responses.
+
+        """
+
+        class Records(logging.Handler):
+            def __init__(self):
+                logging.Handler.__init__(self)
+                self.messages = []
+
+            def emit(self, record):
+                self.messages.append(record.getMessage())
+
+        records = Records()
+        logger = logging.getLogger('pushnotify')
+        level = logger.level
+        logger.addHandler(records)
+        logger.setLevel(logging.DEBUG)
+
+        try:
+            client = pushover.Client('t' * 30, redact_logs=True)
+            client._browser = FakeSession(pushover_handler)
+            client.add_key('u' * 30)
+            client.notify('desc', 'event')
+
+            client = nma.Client('d' * 48, redact_logs=True)
+            client._browser = FakeSession(prowl_handler)
+            client.add_key('k' * 48)
+            client.notify('desc', 'event')
+        finally:
+            logger.removeHandler(records)
+            logger.setLevel(level)
+
+        self.assertTrue(any('...uuuu' in message
+                            for message in records.messages))
+        self.assertTrue(any('...dddd' in message
+                            for message in records.messages))
+        self.assertFalse(any(secret * 30 in message
+                             for message in records.messages
+                             for secret in ('d', 'k', 't', 'u')))
+
+    def test_map_preserves_order(self):
+        """Test that _map returns results in order when using threads.
+
+        """
+
+        def slow_square(item):
+            time.sleep(0.01 * (5 - item))
+            return item * item
+
+        self.client.workers = 5
+        self.assertEqual(self.client._map(slow_square, range(5)),
+                         [0, 1, 4, 9, 16])
+
 
 class NMATest(unittest.TestCase):
     """Test the Notify my Android client.
@@ -493,5 +717,1569 @@ class PushoverTest(unittest.TestCase):
         sounds = self.client.get_sounds()
         self.assertGreater(len(sounds.keys()), 0)
 
+
+class PushoverOfflineTest(unittest.TestCase):
+    """Test the Pushover client against a fake session.
+
+    """
+
+    def setUp(self):
+
+        self.client = pushover.Client('token', workers=4)
+        self.client._browser = FakeSession(pushover_handler)
+
+    def test_notify_concurrent_fan_out(self):
+        """Test pushover.Client.notify sending to every user/device
+        combination with several workers.
+
+        """
+
+        for user in range(10):
+            for device in range(3):
+                self.client.add_key('user{0}'.format(user),
+                                    'device{0}'.format(device))
+
+        self.assertTrue(self.client.notify('a' * 513, 'event'))
+
+        sent = [(data['user'], data['device'])
+                for method, url, data in self.client._browser.requests]
+        self.assertEqual(len(sent), 60)
+        self.assertEqual(len(set(sent)), 30)
+
+    def test_notify_some_invalid(self):
+        """Test pushover.Client.notify sending to every user and raising
+        if any delivery fails.
+
+        """
+
+        self.client.add_key('_bad')
+        self.client.add_key('good')
+        self.assertRaises(exceptions.ApiKeyError, self.client.notify,
+                          'desc', 'event')
+
+        sent = sorted(data['user'] for method, url, data
+                      in self.client._browser.requests)
+        self.assertEqual(sent, ['_bad', 'good'])
+
+        self.client.del_key('_bad')
+        self.assertTrue(self.client.notify('desc', 'event'))
+
+    def test_parse_minimal_fields(self):
+        """Test only copying the requested fields from a successful
+        response, and every field from a failed one.
+
+        """
+
+        response = self.client._parse_response(
+            FakeResponse(json.dumps({'status': 1, 'receipt': 'r',
+                                     'request': 'x'})),
+            fields=('receipt',))
+        self.assertEqual(dict(response),
+                         {'code': 200, 'status': 1, 'receipt': 'r'})
+
+        response = self.client._parse_response(
+            FakeResponse(json.dumps({'status': 0, 'user': 'invalid'}), 400),
+            True, ())
+        self.assertEqual(response['user'], 'invalid')
+        self.assertEqual(sorted(response),
+                         sorted(('code',) + pushover.FIELDS))
+
+
+class SplitDescriptionTest(unittest.TestCase):
+    """Test the split_description function.
+
+    """
+
+    def test_hard_split(self):
+        """Test splitting at the limit when there is no whitespace.
+
+        """
+
+        chunks = list(abstract.split_description('a' * 1025, 512))
+        self.assertEqual([len(chunk) for chunk in chunks], [512, 512, 1])
+
+    def test_words(self):
+        """Test splitting after the last whitespace in each chunk.
+
+        """
+
+        desc = 'the quick brown fox jumps over the lazy dog'
+        chunks = list(abstract.split_description(desc, 10))
+
+        self.assertEqual(''.join(chunks), desc)
+        self.assertEqual(chunks[:3], ['the quick ', 'brown fox ', 'jumps '])
+        self.assertTrue(all(len(chunk) <= 10 for chunk in chunks))
+
+    def test_utf8(self):
+        """Test never splitting a UTF-8 byte string inside a character.
+
+        """
+
+        desc = u'\u00e9'.encode('utf-8') * 10
+        for chunk in abstract.split_description(desc, 5):
+            chunk.decode('utf-8')
+
+    def test_markers(self):
+        """Test part markers, including when they need more digits.
+
+        """
+
+        chunks = list(abstract.split_description('a' * 30, 10,
+                                                 markers=True))
+        self.assertEqual(chunks[0], 'aaaa (1/8)')
+        self.assertEqual(chunks[-1], 'aa (8/8)')
+
+        chunks = list(abstract.split_description('a' * 50, 10,
+                                                 markers=True))
+        self.assertEqual(len(chunks), 25)
+        self.assertTrue(all(len(chunk) <= 10 for chunk in chunks))
+        self.assertEqual(chunks[-1], 'aa (25/25)')
+
+        self.assertEqual(list(abstract.split_description('a', 10, True,
+                                                         True)), ['a'])
+
+    def test_limit_too_small(self):
+        """Test raising ValueError rather than looping forever when
+        limit leaves no room for the description.
+
+        """
+
+        for description, limit, markers in [('a' * 10, 0, False),
+                                            ('a' * 10, 6, True),
+                                            ('a' * 200, 9, True)]:
+            self.assertRaises(ValueError, list, abstract.split_description(
+                description, limit, markers=markers))
+
+
+class KeyBatchTest(unittest.TestCase):
+    """Test sending Prowl and NMA notifications in batches of keys.
+
+    """
+
+    def test_batches(self):
+        """Test that keys are sent KEY_LIMIT at a time, concurrently.
+
+        """
+
+        for module in (nma, prowl):
+            client = module.Client(workers=3)
+            client._browser = FakeSession(prowl_handler)
+            for i in range(12):
+                client.add_key('key{0:02}'.format(i))
+
+            self.assertTrue(client.notify('desc', 'event'))
+
+            sent = sorted(data['apikey'].split(',') for method, url, data
+                          in client._browser.requests)
+            self.assertEqual(sorted(len(keys) for keys in sent),
+                             [2, module.KEY_LIMIT, module.KEY_LIMIT])
+            self.assertEqual(sorted(sum(sent, [])), sorted(client.apikeys))
+
+    def test_failed_batches(self):
+        """Test raising an exception if any batch fails, after sending
+        the others.
+
+        """
+
+        client = prowl.Client()
+        client._browser = FakeSession(prowl_handler)
+        for i in range(prowl.KEY_LIMIT + 1):
+            client.add_key('_key{0}'.format(i))
+
+        self.assertRaises(exceptions.ApiKeyError, client.notify,
+                          'desc', 'event')
+
+        client.apikeys = {}
+        for i in range(prowl.KEY_LIMIT):
+            client.add_key('key{0}'.format(i))
+        client.add_key('_bad')
+        client._browser = FakeSession(prowl_handler)
+        self.assertRaises(exceptions.ApiKeyError, client.notify,
+                          'desc', 'event')
+        self.assertEqual(len(client._browser.requests), 2)
+
+
+class DeliveryReportTest(unittest.TestCase):
+    """Test the delivery reports returned by notify.
+
+    """
+
+    def test_prowl(self):
+        """Test reporting each chunk sent to each key, and finding the
+        invalid key in a rejected batch.
+
+        """
+
+        client = prowl.Client()
+        client._browser = FakeSession(prowl_handler)
+        for key in ['a', 'b', 'c', 'd', '_e', 'f']:
+            client.add_key(key)
+
+        report = client.notify('word ' * 2500, 'event', report=True)
+
+        delivered = sorted((record['user'], record['chunk'])
+                           for record in report if record['status'])
+        self.assertEqual(delivered, [(key, chunk) for key in 'abcdf'
+                                     for chunk in (0, 1)])
+
+        failed = [record for record in report if not record['status']]
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed[0]['user'], '_e')
+        self.assertEqual(failed[0]['code'], 401)
+        self.assertTrue(isinstance(failed[0]['error'],
+                                   exceptions.ApiKeyError))
+        self.assertTrue(all(record['latency'] >= 0 for record in report))
+
+    def test_pushover(self):
+        """Test reporting each device, including connection errors.
+
+        """
+
+        def handler(method, url, data):
+            if data['user'] == 'down':
+                raise requests.exceptions.ConnectionError('refused')
+            return pushover_handler(method, url, data)
+
+        client = pushover.Client('token')
+        client._browser = FakeSession(handler)
+        client.add_key('a', 'phone')
+        client.add_key('_b')
+        client.add_key('down')
+
+        report = sorted(client.notify('desc', 'event', report=True),
+                        key=lambda record: record['user'])
+
+        self.assertEqual([(record['user'], record['device'],
+                           record['status'], record['code'])
+                          for record in report],
+                         [('_b', None, False, 400),
+                          ('a', 'phone', True, 200),
+                          ('down', None, False, None)])
+        self.assertTrue(isinstance(report[0]['error'],
+                                   exceptions.ApiKeyError))
+        self.assertTrue(isinstance(report[2]['error'],
+                                   requests.exceptions.ConnectionError))
+
+        client.del_key('_b')
+        self.assertRaises(requests.exceptions.ConnectionError,
+                          client.notify, 'desc', 'event')
+
+    def test_unparseable(self):
+        """Test recording deliveries whose response can't be parsed,
+        rather than losing the rest of the report.
+
+        """
+
+        def handler(method, url, data):
+            if data.get('description', data.get('message')) == 'garbled':
+                return FakeResponse('<html>maintenance</html>')
+            return (pushover_handler if 'user' in data else
+                    prowl_handler)(method, url, data)
+
+        for module in (prowl, pushover):
+            client = module.Client('token')
+            client._browser = FakeSession(handler)
+            client.add_key('a')
+            client.add_key('b')
+
+            report = client.notify('x' * module.DESC_LIMIT + 'garbled',
+                                   'event', report=True)
+
+            self.assertEqual(sorted((record['user'], record['chunk'],
+                                     record['status'])
+                                    for record in report),
+                             [('a', 0, True), ('a', 1, False),
+                              ('b', 0, True), ('b', 1, False)])
+            for record in report:
+                if not record['status']:
+                    self.assertTrue(isinstance(
+                        record['error'],
+                        exceptions.UnrecognizedResponseError))
+
+class ResponseTest(unittest.TestCase):
+    """Test per-call responses and the _last compatibility view.
+
+    """
+
+    def setUp(self):
+
+        self.client = prowl.Client()
+        self.client._browser = FakeSession(prowl_handler)
+
+    def test_response_read_only(self):
+        """Test that a Response can't be changed.
+
+        """
+
+        response = abstract.Response(code='200')
+
+        def set_code():
+            response['code'] = '500'
+
+        self.assertRaises(TypeError, set_code)
+        self.assertEqual(response['code'], '200')
+
+    def test_html_server_error(self):
+        """Test that a 5xx HTML page, such as from a proxy, raises
+        ServerError and is retried.
+
+        """
+
+        page = FakeResponse('<html><body>503 Service Unavailable</body>'
+                            '</html>', 503)
+        answers = []
+
+        def handler(method, url, data):
+            answers.append(url)
+            if len(answers) == 1:
+                return page
+            return (pushover_handler if 'pushover' in url else
+                    prowl_handler)(method, url, data)
+
+        for client in (nma.Client(), prowl.Client(),
+                       pushover.Client('token')):
+            client._browser = FakeSession(lambda *args: page)
+            client.add_key('good')
+            self.assertRaises(exceptions.ServerError, client.notify,
+                              'desc', 'event')
+
+            del answers[:]
+            client._browser = FakeSession(handler)
+            client.retry_policy = retry.RetryPolicy(backoff_base=0)
+            self.assertTrue(client.notify('desc', 'event'))
+            self.assertEqual(len(answers), 2)
+
+    def test_last_is_per_thread(self):
+        """Test that _last only shows responses from the calling thread.
+
+        """
+
+        self.assertTrue(self.client.verify_user('good'))
+        self.assertEqual(self.client._last['code'], '200')
+
+        thread = threading.Thread(target=self.client.verify_user,
+                                  args=('_bad',))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(self.client._last['code'], '200')
+
+    def test_parse_xml(self):
+        """Test parsing Prowl responses from their undecoded content.
+
+        """
+
+        response = self.client._parse_response(FakeResponse(
+            u'<?xml version="1.0" encoding="UTF-8"?><prowl>'
+            u'<error code="400">Caf\xe9 is too long</error></prowl>'), True)
+        self.assertEqual(response['message'], u'Caf\xe9 is too long')
+
+        response = self.client._parse_response(FakeResponse(
+            '<?xml version="1.0" encoding="UTF-8"?><prowl>'
+            '<success code="200" remaining="999" resetdate="1234567890" />'
+            '<retrieve token="tok" url="http://example.com/" /></prowl>'))
+        self.assertEqual((response['token'], response['token_url']),
+                         ('tok', 'http://example.com/'))
+
+
+class FakeClock(object):
+    """A clock that only moves when something sleeps on it.
+
+    """
+
+    def __init__(self, now=1000.0):
+
+        self.now = now
+
+    def sleep(self, seconds):
+
+        self.now += seconds
+
+    def time(self):
+
+        return self.now
+
+
+class RateLimiterTest(unittest.TestCase):
+    """Test the RateLimiter class.
+
+    """
+
+    def setUp(self):
+
+        self.clock = FakeClock()
+        self.limiter = ratelimit.RateLimiter(
+            burst=2, clock=self.clock.time, sleep=self.clock.sleep)
+
+    def test_unknown_limit(self):
+        """Test that nothing is paced before the limit is known.
+
+        """
+
+        for i in range(100):
+            self.assertEqual(self.limiter.acquire(), 0)
+
+    def test_paces_until_reset(self):
+        """Test that the remaining calls are spread out until the reset.
+
+        """
+
+        self.limiter.update(10, self.clock.now + 100)
+
+        waits = [self.limiter.acquire() for i in range(10)]
+
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertAlmostEqual(waits[2], 10)
+        self.assertTrue(self.clock.now <= 1000 + 100)
+
+    def test_exceeded(self):
+        """Test waiting for the reset after the limit was exceeded, and
+        max_wait.
+
+        """
+
+        self.limiter.exceeded(self.clock.now + 30)
+        self.assertAlmostEqual(self.limiter.acquire(), 30)
+        self.assertEqual(self.limiter.acquire(), 0)
+
+        self.limiter.max_wait = 5
+        self.limiter.exceeded()
+        self.assertRaises(exceptions.RateLimitExceeded, self.limiter.acquire)
+
+    def test_prowl_client_updates(self):
+        """Test that the Prowl client reports the limit in responses.
+
+        """
+
+        client = prowl.Client(rate_limiter=self.limiter)
+        client._browser = FakeSession(prowl_handler)
+        client.verify_user('good')
+
+        self.assertEqual(self.limiter.remaining, 999)
+        self.assertEqual(self.limiter.reset_at, 1234567890)
+
+
+class RetryPolicyTest(unittest.TestCase):
+    """Test the RetryPolicy class and the clients' use of it.
+
+    """
+
+    def setUp(self):
+
+        self.sleeps = []
+        self.policy = retry.RetryPolicy(max_attempts=3, backoff_base=1,
+                                        jitter=False,
+                                        sleep=self.sleeps.append)
+
+    def test_backoff(self):
+        """Test the exponential backoff and its cap.
+
+        """
+
+        self.policy.backoff_cap = 3
+        self.assertEqual([self.policy.backoff(n) for n in range(1, 5)],
+                         [1, 2, 3, 3])
+
+        self.policy.jitter = True
+        self.assertTrue(0 <= self.policy.backoff(4) <= 3)
+
+    def test_prowl_retries(self):
+        """Test prowl.Client.notify retrying server errors until it runs
+        out of attempts.
+
+        """
+
+        client = prowl.Client(retry_policy=self.policy)
+        client.add_key('good')
+
+        client._browser = FakeSession(flaky(prowl_handler, 2))
+        self.assertTrue(client.notify('desc', 'event'))
+        self.assertEqual(self.sleeps, [1, 2])
+
+        client._browser = FakeSession(flaky(prowl_handler, 3))
+        self.assertRaises(exceptions.ServerError, client.notify,
+                          'desc', 'event')
+
+    def test_pushover_retries_per_delivery(self):
+        """Test pushover.Client.notify only resending to the deliveries
+        that failed.
+
+        """
+
+        client = pushover.Client('token', retry_policy=self.policy)
+        client.add_key('good')
+        client.add_key('other')
+
+        def handler(method, url, data):
+            if data['user'] == 'other':
+                return pushover_handler(method, url, data)
+            return flaky_handler(method, url, data)
+
+        flaky_handler = flaky(pushover_handler, 1)
+        client._browser = FakeSession(handler)
+
+        self.assertTrue(client.notify('desc', 'event'))
+        sent = [data['user'] for method, url, data in
+                client._browser.requests]
+        self.assertEqual(sorted(sent), ['good', 'good', 'other'])
+
+
+class OutboxTest(unittest.TestCase):
+    """Test the Outbox class.
+
+    """
+
+    def setUp(self):
+
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'outbox.db')
+
+        self.client = prowl.Client()
+        self.client._browser = FakeSession(prowl_handler)
+        self.client.add_key('good')
+
+        self.outbox = outbox.Outbox(
+            self.client, self.path, poll_interval=0.01,
+            retry_policy=retry.RetryPolicy(max_attempts=2, backoff_base=0))
+
+    def tearDown(self):
+
+        self.outbox.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_drain(self):
+        """Test queueing and sending notifications in order.
+
+        """
+
+        for i in range(3):
+            self.outbox.notify('desc {0}'.format(i), 'event',
+                               kwargs={'priority': 1})
+        self.assertEqual(self.outbox.pending(), 3)
+        self.assertEqual(self.client._browser.requests, [])
+
+        self.assertEqual(self.outbox.drain(), 3)
+        self.assertEqual(self.outbox.pending(), 0)
+        self.assertEqual(
+            [data['description'] for method, url, data
+             in self.client._browser.requests],
+            ['desc 0', 'desc 1', 'desc 2'])
+
+    def test_failures(self):
+        """Test retrying server errors and keeping failed notifications.
+
+        """
+
+        self.client._browser = FakeSession(
+            flaky(prowl_handler, 1))
+        self.outbox.notify('desc', 'event')
+        self.assertEqual(self.outbox.drain(), 2)
+        self.assertEqual(self.outbox.pending(), 0)
+
+        self.client.apikeys = {}
+        self.client.add_key('_bad')
+        self.client._browser = FakeSession(prowl_handler)
+        self.outbox.notify('desc', 'event')
+        self.outbox.drain()
+
+        failed = self.outbox.failed()
+        self.assertEqual(len(failed), 1)
+        self.assertTrue('ApiKeyError' in failed[0][3])
+
+    def test_partial_failure(self):
+        """Test retrying only the keys in a failed batch, and keeping
+        only the users that failed for good.
+
+        """
+
+        failing = []
+
+        def handler(method, url, data):
+            if 'k7' in data['apikey'].split(',') and not failing:
+                failing.extend(data['apikey'].split(','))
+                return FakeResponse(
+                    '<?xml version="1.0" encoding="UTF-8"?><prowl>'
+                    '<error code="500">Internal error</error></prowl>', 500)
+            return prowl_handler(method, url, data)
+
+        self.client.apikeys = {}
+        for i in range(10):
+            self.client.add_key('k{0}'.format(i))
+        self.client._browser = FakeSession(handler)
+
+        self.outbox.notify('desc', 'event')
+        self.assertEqual(self.outbox.drain(), 2)
+        self.assertEqual(self.outbox.pending(), 0)
+        self.assertEqual(self.outbox.failed(), [])
+
+        sent = [key for method, url, data in self.client._browser.requests
+                for key in data['apikey'].split(',')]
+        self.assertEqual(sorted(sent), sorted(
+            ['k{0}'.format(i) for i in range(10)] + failing))
+
+        flaky_handler = flaky(pushover_handler, 1)
+
+        def pushover_flaky(method, url, data):
+            if data['user'] == 'flaky':
+                return flaky_handler(method, url, data)
+            return pushover_handler(method, url, data)
+
+        client = pushover.Client('token')
+        client._browser = FakeSession(pushover_flaky)
+        for user in ('_bad', 'good', 'flaky'):
+            client.add_key(user)
+        pushover_outbox = outbox.Outbox(
+            client, os.path.join(self.tempdir, 'pushover.db'),
+            retry_policy=retry.RetryPolicy(max_attempts=2, backoff_base=0))
+
+        try:
+            pushover_outbox.notify('desc', 'event')
+            self.assertEqual(pushover_outbox.drain(), 2)
+            failed = pushover_outbox.failed()
+        finally:
+            pushover_outbox.close()
+
+        sent = sorted(data['user'] for method, url, data
+                      in client._browser.requests)
+        self.assertEqual(sent, ['_bad', 'flaky', 'flaky', 'good'])
+        self.assertEqual(len(failed), 1)
+        self.assertTrue('ApiKeyError' in failed[0][3])
+
+    def test_old_database(self):
+        """Test opening a database made before recipients were tracked.
+
+        """
+
+        path = os.path.join(self.tempdir, 'old.db')
+        db = sqlite3.connect(path)
+        db.execute(outbox.SCHEMA.replace(',\n    recipients TEXT', ''))
+        db.close()
+
+        old = outbox.Outbox(self.client, path)
+        try:
+            old.notify('desc', 'event')
+            self.assertEqual(old.drain(), 1)
+        finally:
+            old.close()
+
+    def test_non_ascii(self):
+        """Test queueing a UTF-8 byte string description and event.
+
+        """
+
+        self.outbox.notify('caf\xc3\xa9 down', '\xc3\xa9vent')
+        self.assertEqual(self.outbox.drain(), 1)
+
+        method, url, data = self.client._browser.requests[0]
+        self.assertEqual(data['description'], 'caf\xc3\xa9 down')
+        self.assertEqual(data['event'], '\xc3\xa9vent')
+
+    def test_unexpected_error(self):
+        """Test failing notifications that raise unexpected errors, and
+        ones abandoned on their last attempt.
+
+        """
+
+        def handler(method, url, data):
+            raise requests.exceptions.TooManyRedirects('loop')
+
+        self.client._browser = FakeSession(handler)
+        self.outbox.notify('desc', 'event')
+        self.assertEqual(self.outbox.drain(), 1)
+        self.assertEqual(self.outbox.pending(), 0)
+        self.assertTrue('TooManyRedirects' in self.outbox.failed()[0][3])
+
+        self.outbox.notify('crashes', 'event')
+        self.outbox._claim()
+        self.outbox.lease = 0
+        self.outbox._claim()
+        self.assertEqual(self.outbox.drain(), 0)
+        self.assertEqual(self.outbox.pending(), 0)
+        self.assertEqual(self.outbox.failed()[1][3],
+                         'abandoned after 2 attempts')
+
+    def test_recovers_abandoned(self):
+        """Test that notifications claimed by a crashed dispatcher are
+        sent again.
+
+        """
+
+        self.outbox.notify('desc', 'event')
+        self.outbox._claim()
+        self.assertEqual(self.outbox.drain(), 0)
+
+        reopened = outbox.Outbox(self.client, self.path, lease=0)
+        self.assertEqual(reopened.drain(), 1)
+        self.assertEqual(reopened.pending(), 0)
+        reopened.close()
+
+    def test_background_thread(self):
+        """Test sending notifications from the background thread.
+
+        """
+
+        self.outbox.start()
+        self.outbox.notify('desc', 'event')
+
+        deadline = time.time() + 5
+        while self.outbox.pending() and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.outbox.stop()
+        self.assertEqual(self.outbox.pending(), 0)
+
+
+class VerifyCacheTest(unittest.TestCase):
+    """Test caching verify_user and verify_device results.
+
+    """
+
+    def setUp(self):
+
+        self.clock = FakeClock()
+        self.cache = cache.VerifyCache(valid_ttl=100, invalid_ttl=10,
+                                       maxsize=3, clock=self.clock.time)
+        self.client = pushover.Client('token', verify_cache=self.cache)
+        self.client._browser = FakeSession(pushover_handler)
+
+    def test_ttls(self):
+        """Test keeping valid and invalid results for their TTLs.
+
+        """
+
+        for i in range(3):
+            self.assertTrue(self.client.verify_user('good'))
+            self.assertFalse(self.client.verify_user('_bad'))
+        self.assertEqual(len(self.client._browser.requests), 2)
+
+        self.clock.sleep(11)
+        self.client.verify_user('good')
+        self.client.verify_user('_bad')
+        self.assertEqual(len(self.client._browser.requests), 3)
+
+        self.clock.sleep(90)
+        self.client.verify_user('good')
+        self.assertEqual(len(self.client._browser.requests), 4)
+
+    def test_lru(self):
+        """Test evicting the least recently used result when full.
+
+        """
+
+        for user in ['a', 'b', 'c', 'a', 'd']:
+            self.client.verify_user(user)
+        self.assertEqual(len(self.cache), 3)
+
+        self.client.verify_user('a')
+        self.client.verify_user('b')
+        self.assertEqual(len(self.client._browser.requests), 5)
+
+    def test_invalidate(self):
+        """Test forgetting results for a user and all of its devices.
+
+        """
+
+        self.client.verify_user('good')
+        self.client.verify_device('good', 'phone')
+        self.client.verify_user('other')
+
+        self.client.invalidate_verification('good')
+        self.client.verify_user('good')
+        self.client.verify_device('good', 'phone')
+        self.client.verify_user('other')
+        self.assertEqual(len(self.client._browser.requests), 5)
+
+
+class DedupCacheTest(unittest.TestCase):
+    """Test skipping notifications that were just sent.
+
+    """
+
+    def setUp(self):
+
+        self.clock = FakeClock()
+        self.cache = cache.DedupCache(window=60, clock=self.clock.time)
+
+    def test_pushover(self):
+        """Test that only recipients not sent a notification within the
+        window are sent it again.
+
+        """
+
+        client = pushover.Client('token', dedup_cache=self.cache)
+        client._browser = FakeSession(pushover_handler)
+        client.add_key('a')
+
+        self.assertTrue(client.notify('desc', 'event'))
+        self.assertTrue(client.notify('desc', 'event'))
+        self.assertEqual(len(client._browser.requests), 1)
+
+        client.add_key('b')
+        client.notify('desc', 'event')
+        self.assertEqual(client._browser.requests[-1][2]['user'], 'b')
+
+        client.notify('other', 'event')
+        client.notify('desc', 'event', kwargs={'priority': 1})
+        self.assertEqual(len(client._browser.requests), 6)
+
+        self.clock.sleep(61)
+        client.notify('desc', 'event')
+        self.assertEqual(len(client._browser.requests), 8)
+
+    def test_failures_not_remembered(self):
+        """Test that failed notifications aren't skipped next time.
+
+        """
+
+        client = prowl.Client(dedup_cache=self.cache)
+        client._browser = FakeSession(prowl_handler)
+        client.add_key('_bad')
+
+        for i in range(2):
+            self.assertRaises(exceptions.ApiKeyError, client.notify,
+                              'desc', 'event')
+        self.assertEqual(len(client._browser.requests), 2)
+
+    def test_sqlite(self):
+        """Test sharing a dedup cache through SQLite.
+
+        """
+
+        tempdir = tempfile.mkdtemp()
+        path = os.path.join(tempdir, 'dedup.db')
+
+        try:
+            clients = []
+            for i in range(2):
+                shared = cache.SQLiteDedupCache(path, window=60, maxsize=2,
+                                                clock=self.clock.time)
+                client = prowl.Client(dedup_cache=shared)
+                client._browser = FakeSession(prowl_handler)
+                client.add_key('good')
+                clients.append(client)
+
+            clients[0].notify('desc', 'event')
+            self.assertTrue(clients[1].notify('desc', 'event'))
+            self.assertEqual(clients[1]._browser.requests, [])
+
+            for description in ['a', 'b', 'c']:
+                clients[0].notify(description, 'event')
+            self.assertEqual(len(shared), 2)
+
+            self.clock.sleep(61)
+            clients[1].notify('c', 'event')
+            self.assertEqual(len(clients[1]._browser.requests), 1)
+
+            for client in clients:
+                client.dedup_cache.close()
+        finally:
+            shutil.rmtree(tempdir)
+
+
+    def test_sqlite_add_many(self):
+        """Test adding many notifications to an SQLite dedup cache, and
+        deleting expired and excess ones.
+
+        """
+
+        tempdir = tempfile.mkdtemp()
+        shared = cache.SQLiteDedupCache(os.path.join(tempdir, 'dedup.db'),
+                                        window=60, maxsize=100,
+                                        clock=self.clock.time)
+
+        def rows():
+            return shared._db.execute(
+                'SELECT COUNT(*) FROM dedup').fetchone()[0]
+
+        try:
+            shared.add_many([(('key', i), i) for i in range(150)])
+            self.assertEqual(rows(), 100)
+            self.assertEqual(shared.get(('key', 149)), 149)
+
+            shared.add('new', True)
+            self.assertEqual(rows(), 101)
+
+            self.clock.sleep(61)
+            self.assertEqual(len(shared), 0)
+            shared.add('newer', True)
+            self.assertEqual(rows(), 1)
+        finally:
+            shared.close()
+            shutil.rmtree(tempdir)
+
+class HooksTest(unittest.TestCase):
+    """Test the hooks and the metrics collector.
+
+    """
+
+    def setUp(self):
+
+        self.client = prowl.Client(
+            retry_policy=retry.RetryPolicy(backoff_base=0))
+        self.client._browser = FakeSession(flaky(prowl_handler, 1))
+        self.client.add_key('good')
+
+    def test_hooks(self):
+        """Test adding, calling and deleting hooks.
+
+        """
+
+        events = []
+
+        def broken(info):
+            raise RuntimeError
+
+        self.assertRaises(ValueError, self.client.add_hook, 'bogus',
+                          events.append)
+        for event in abstract.HOOK_EVENTS:
+            self.client.add_hook(event, broken)
+            self.client.add_hook(event, events.append)
+
+        self.client.notify('desc', 'event')
+
+        self.assertEqual(
+            [info['event'] for info in events],
+            ['notify', 'request_start', 'request_end', 'error', 'retry',
+             'request_start', 'request_end', 'rate_limit'])
+        self.assertEqual(events[0]['chunks'], 1)
+        self.assertEqual(events[2]['status_code'], 500)
+        self.assertTrue(events[2]['bytes'] > 0)
+        self.assertEqual(events[4]['attempt'], 2)
+        self.assertEqual(events[7]['remaining'], 999)
+        self.assertTrue(all(info['provider'] == 'prowl' for info in events))
+
+        for event in abstract.HOOK_EVENTS:
+            self.client.del_hook(event, broken)
+            self.client.del_hook(event, events.append)
+        self.assertEqual(self.client._hooks, {})
+
+    def test_collector(self):
+        """Test collecting and rendering metrics.
+
+        """
+
+        collector = metrics.Collector()
+        collector.attach(self.client)
+
+        self.client.notify('desc', 'event')
+        self.client.add_key('_bad')
+        self.client.del_key('good')
+        self.assertRaises(exceptions.ApiKeyError, self.client.notify,
+                          'desc', 'event')
+
+        labels = {'provider': 'prowl', 'method': 'POST'}
+        self.assertEqual(collector.get('requests_total', status='200',
+                                       **labels), 2)
+        self.assertEqual(collector.get('requests_total', status='500',
+                                       **labels), 2)
+        self.assertEqual(collector.get('request_duration_seconds_count',
+                                       **labels), 4)
+        self.assertEqual(collector.get('retries_total', provider='prowl'),
+                         2)
+        self.assertEqual(collector.get('errors_total', provider='prowl',
+                                       error='ApiKeyError'), 1)
+        self.assertEqual(collector.get('rate_limit_remaining',
+                                       provider='prowl'), 999)
+
+        text = collector.render()
+        self.assertTrue('# TYPE pushnotify_request_duration_seconds '
+                        'histogram' in text)
+        self.assertTrue('pushnotify_request_duration_seconds_bucket{'
+                        'le="+Inf",method="POST",provider="prowl"} 4' in text)
+
+        collector.detach(self.client)
+        self.assertEqual(self.client._hooks, {})
+
+
+class MultiClientTest(unittest.TestCase):
+    """Test the MultiClient class.
+
+    """
+
+    def setUp(self):
+
+        def handler(method, url, data):
+            if 'pushover' in url:
+                return pushover_handler(method, url, data)
+            return prowl_handler(method, url, data)
+
+        self.session = FakeSession(handler)
+        self.client = multi.MultiClient({'pushover': 'token'},
+                                        session=self.session, workers=4)
+
+    def test_notify(self):
+        """Test sending to recipients of every client type and reporting
+        the outcome for each.
+
+        """
+
+        self.client.add_recipient('ann', 'nma', 'a')
+        self.client.add_recipient('bob', 'Prowl', '_b')
+        self.client.add_recipient('cat', 'pushover', 'c', 'phone')
+        self.client.add_recipient('cat', 'pushover', 'c', 'tablet')
+
+        self.assertRaises(ValueError, self.client.add_recipient, 'cat',
+                          'prowl', 'c')
+        self.assertRaises(ValueError, self.client.add_recipient, 'dan',
+                          'bogus', 'd')
+
+        outcomes = self.client.notify(
+            'desc', 'event', kwargs={'priority': 1},
+            provider_kwargs={'pushover': {'sound': 'siren'}})
+
+        self.assertEqual(sorted(outcomes), ['ann', 'bob', 'cat'])
+        self.assertTrue(outcomes['ann']['status'])
+        self.assertEqual(outcomes['ann']['provider'], 'nma')
+        self.assertFalse(outcomes['bob']['status'])
+        self.assertTrue(isinstance(outcomes['bob']['error'],
+                                   exceptions.ApiKeyError))
+        self.assertTrue(outcomes['cat']['status'])
+
+        sent = [data for method, url, data in self.session.requests
+                if 'pushover' in url]
+        self.assertEqual(sorted(data['device'] for data in sent),
+                         ['phone', 'tablet'])
+        self.assertTrue(all(data['sound'] == 'siren' and
+                            data['priority'] == '1' for data in sent))
+
+        outcomes = self.client.notify('desc', 'event', report=True)
+        self.assertFalse(outcomes['bob']['status'])
+        self.assertEqual(len(outcomes['bob']['result']), 1)
+        self.assertEqual(len(outcomes['cat']['result']), 2)
+
+        self.client.del_recipient('bob')
+        self.assertEqual(sorted(self.client.notify('desc', 'event')),
+                         ['ann', 'cat'])
+
+
+class VerifyManyTest(unittest.TestCase):
+    """Test verifying many keys at once.
+
+    """
+
+    def test_verify_many(self):
+        """Test verifying users and devices concurrently, including ones
+        that raise exceptions.
+
+        """
+
+        client = pushover.Client('token')
+        client._browser = FakeSession(pushover_handler)
+
+        keys = (['user{0}'.format(i) for i in range(50)] +
+                ['_bad', ('good', 'phone'), ('_bad', 'phone')])
+
+        results = dict((key, (valid, error)) for key, valid, error
+                       in client.verify_many(iter(keys), workers=8))
+
+        self.assertEqual(len(results), len(keys))
+        self.assertEqual(results['user0'], (1, None))
+        self.assertEqual(results['_bad'], (0, None))
+        self.assertEqual(results[('good', 'phone')], (1, None))
+        self.assertTrue(isinstance(results[('_bad', 'phone')][1],
+                                   exceptions.ApiKeyError))
+
+    def test_stop_early(self):
+        """Test that closing the generator stops taking keys.
+
+        """
+
+        client = prowl.Client()
+        client._browser = FakeSession(prowl_handler)
+
+        results = client.verify_many(('key{0}'.format(i)
+                                      for i in range(10000)), workers=2)
+        next(results)
+        results.close()
+        time.sleep(0.05)
+
+        self.assertTrue(len(client._browser.requests) < 100)
+
+    def test_keys_raise(self):
+        """Test raising the error from iterating over the keys rather
+        than waiting forever.
+
+        """
+
+        client = prowl.Client()
+        client._browser = FakeSession(prowl_handler)
+
+        def keys():
+            yield 'key0'
+            yield 'key1'
+            raise IOError('keys unavailable')
+
+        results = []
+        try:
+            for result in client.verify_many(keys(), workers=4):
+                results.append(result[0])
+        except IOError:
+            pass
+        else:
+            self.fail('IOError not raised')
+
+        self.assertEqual(sorted(results), ['key0', 'key1'])
+
+
+class SoundsCacheTest(unittest.TestCase):
+    """Test caching pushover.Client.get_sounds results.
+
+    """
+
+    def setUp(self):
+
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'sounds.json')
+        self.clock = FakeClock()
+        self.modified = False
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tempdir)
+
+    def handler(self, method, url, data):
+
+        if (self.session.headers[-1] and not self.modified and
+                self.session.headers[-1].get('If-None-Match') == '"v1"'):
+            return FakeResponse('', 304)
+
+        return FakeResponse(json.dumps({'status': 1,
+                                        'sounds': {'bike': 'Bike'}}),
+                            headers={'ETag': '"v1"'})
+
+    def make_client(self):
+
+        sounds_cache = cache.SoundsCache(ttl=60, path=self.path,
+                                         clock=self.clock.time)
+        client = pushover.Client('token', sounds_cache=sounds_cache)
+        client._browser = self.session = FakeSession(self.handler)
+
+        return client
+
+    def test_cached(self):
+        """Test fetching the sound list once within the TTL, and reading
+        it back from disk.
+
+        """
+
+        client = self.make_client()
+        for i in range(3):
+            self.assertEqual(client.get_sounds(), {'bike': 'Bike'})
+        self.assertEqual(len(self.session.requests), 1)
+
+        client = self.make_client()
+        self.assertEqual(client.get_sounds(), {'bike': 'Bike'})
+        self.assertEqual(len(self.session.requests), 0)
+        self.assertFalse('token' in open(self.path).read())
+
+    def test_revalidate(self):
+        """Test revalidating the sound list with its ETag after the TTL.
+
+        """
+
+        client = self.make_client()
+        client.get_sounds()
+
+        self.clock.sleep(61)
+        self.assertEqual(client.get_sounds(), {'bike': 'Bike'})
+        self.assertEqual(self.session.headers[-1],
+                         {'If-None-Match': '"v1"'})
+
+        self.clock.sleep(61)
+        self.modified = True
+        client.get_sounds()
+        client.get_sounds()
+        self.assertEqual(len(self.session.requests), 3)
+
+
+class AsyncClientTest(unittest.TestCase):
+    """Test the asynchronous clients against a fake session.
+
+    """
+
+    def setUp(self):
+
+        self.client = pushover.AsyncClient('token', workers=4)
+        self.client.client._browser = FakeSession(pushover_handler)
+
+    def tearDown(self):
+
+        self.client.close()
+
+    def test_verify_user(self):
+        """Test pushover.AsyncClient.verify_user results and callbacks.
+
+        """
+
+        results = []
+        pending = [self.client.verify_user(user, callback=results.append)
+                   for user in ['good', '_bad'] * 10]
+
+        self.assertEqual([result.get(5) for result in pending],
+                         [1, 0] * 10)
+        self.assertEqual(len(results), 20)
+
+    def test_notify_raises(self):
+        """Test pushover.AsyncClient.notify raising the same exception as
+        the synchronous client.
+
+        """
+
+        self.client.add_key('_bad')
+        result = self.client.notify('desc', 'event')
+
+        self.assertRaises(exceptions.ApiKeyError, result.get, 5)
+
+
+class AggregatorTest(unittest.TestCase):
+    """Test the Aggregator class.
+
+    """
+
+    def setUp(self):
+
+        self.client = prowl.Client()
+        self.client._browser = FakeSession(prowl_handler)
+        self.client.add_key('good')
+
+    def test_storm(self):
+        """Test collapsing a burst of notifications into one per group.
+
+        """
+
+        aggregator = aggregate.Aggregator(self.client, window=60)
+
+        for i in range(100):
+            aggregator.notify('db down', 'alert')
+        aggregator.notify('db up', 'alert')
+        aggregator.notify('disk full', 'other', kwargs={'priority': 2})
+        self.assertEqual(self.client._browser.requests, [])
+
+        aggregator.flush()
+
+        sent = sorted((data['event'], data['description'])
+                      for method, url, data
+                      in self.client._browser.requests)
+        self.assertEqual(sent, [('alert (101 notifications)',
+                                 'db down (x100)\ndb up'),
+                                ('other', 'disk full')])
+
+        aggregator.flush()
+        self.assertEqual(len(self.client._browser.requests), 2)
+
+    def test_non_ascii(self):
+        """Test combining unicode and UTF-8 byte string notifications.
+
+        """
+
+        aggregator = aggregate.Aggregator(self.client)
+        aggregator.notify(u'caf\xe9 down', u'caf\xe9')
+        aggregator.notify(u'caf\xe9 down', u'caf\xe9')
+        aggregator.notify('th\xc3\xa9 down', u'caf\xe9')
+        aggregator.close()
+
+        method, url, data = self.client._browser.requests[0]
+        self.assertEqual(data['event'].decode('utf-8'),
+                         u'caf\xe9 (3 notifications)')
+        self.assertEqual(data['description'].decode('utf-8'),
+                         u'caf\xe9 down (x2)\nth\xe9 down')
+
+    def test_window(self):
+        """Test sending a group once its window ends, or it is full.
+
+        """
+
+        aggregator = aggregate.Aggregator(
+            self.client, window=0.05, group_by=lambda event: event[:5],
+            max_pending=3)
+
+        for i in range(3):
+            aggregator.notify('full {0}'.format(i), 'first {0}'.format(i))
+        self.assertEqual(len(self.client._browser.requests), 1)
+
+        aggregator.notify('desc', 'event')
+        deadline = time.time() + 5
+        while (len(self.client._browser.requests) < 2 and
+               time.time() < deadline):
+            time.sleep(0.01)
+
+        self.assertEqual(
+            [data['description'] for method, url, data
+             in self.client._browser.requests],
+            ['full 0\nfull 1\nfull 2', 'desc'])
+
+    def test_split(self):
+        """Test that long combined notifications are split.
+
+        """
+
+        aggregator = aggregate.Aggregator(self.client)
+        for i in range(200):
+            aggregator.notify('line {0:04d} '.format(i) + 'x' * 40, 'event')
+        aggregator.close()
+
+        requests = self.client._browser.requests
+        self.assertTrue(len(requests) > 1)
+        for method, url, data in requests:
+            self.assertTrue(len(data['description']) <= prowl.DESC_LIMIT)
+
+    def test_errors(self):
+        """Test raising errors from flush, close and notify once every
+        group has been tried.
+
+        """
+
+        self.client.add_key('_bad')
+        aggregator = aggregate.Aggregator(self.client, max_pending=2)
+
+        aggregator.notify('desc', 'first')
+        aggregator.notify('desc', 'second')
+        self.assertRaises(exceptions.ApiKeyError, aggregator.flush)
+        self.assertEqual(len(self.client._browser.requests), 2)
+
+        aggregator.notify('desc', 'third')
+        self.assertRaises(exceptions.ApiKeyError, aggregator.close)
+
+        aggregator.notify('desc', 'fourth')
+        self.assertRaises(exceptions.ApiKeyError, aggregator.notify,
+                          'desc', 'fourth')
+        self.assertEqual(len(self.client._browser.requests), 4)
+
+
+def use_fake_pushover(client):
+    """Answer client's requests with pushover_handler, in a worker
+    process of a ProcessPoolSender.
+
+    """
+
+    client._browser = FakeSession(pushover_handler)
+
+
+class ProcessPoolSenderTest(unittest.TestCase):
+    """Test the ProcessPoolSender class.
+
+    """
+
+    def setUp(self):
+
+        self.sender = processes.ProcessPoolSender(
+            'pushover', 'token', processes=2, shard_size=4,
+            setup=use_fake_pushover, workers=2)
+
+    def tearDown(self):
+
+        self.sender.close()
+
+    def test_notify(self):
+        """Test merging the reports and metrics of every shard.
+
+        """
+
+        recipients = dict(('user{0:02d}'.format(i), []) for i in range(20))
+        recipients['_bad'] = []
+        recipients['user00'] = ['phone', 'tablet']
+
+        report = self.sender.notify(recipients, 'a' * 600, 'event')
+
+        delivered = sorted((record['user'], record['device'],
+                            record['chunk'])
+                           for record in report if record['status'])
+        self.assertEqual(len(delivered), 42)
+        self.assertEqual(len(set(delivered)), 42)
+        self.assertEqual(delivered[:4], [('user00', 'phone', 0),
+                                         ('user00', 'phone', 1),
+                                         ('user00', 'tablet', 0),
+                                         ('user00', 'tablet', 1)])
+
+        failed = [record for record in report if not record['status']]
+        self.assertEqual([record['user'] for record in failed],
+                         ['_bad', '_bad'])
+        self.assertTrue(isinstance(failed[0]['error'],
+                                   exceptions.ApiKeyError))
+
+        collector = self.sender.collector
+        self.assertEqual(collector.get('requests_total',
+                                       provider='pushover', method='POST',
+                                       status='200'), 42)
+        self.assertEqual(collector.get('requests_total',
+                                       provider='pushover', method='POST',
+                                       status='400'), 2)
+        self.assertEqual(collector.get('notifications_total',
+                                       provider='pushover'), 6)
+
+        self.sender.notify({'user00': []}, 'desc', 'event')
+        self.assertEqual(collector.get('notifications_total',
+                                       provider='pushover'), 7)
+
+    def test_invalid(self):
+        """Test rejecting unknown client types and shared sessions.
+
+        """
+
+        self.assertRaises(ValueError, processes.ProcessPoolSender, 'nope')
+        self.assertRaises(ValueError, processes.ProcessPoolSender,
+                          'pushover', session=requests.Session())
+
+
+class FakeReceipts(object):
+    """A stand-in for Pushover's messages and receipts API, giving each
+    emergency priority message its own receipt.
+
+    """
+
+    def __init__(self):
+
+        self.receipts = {}
+        self.cancelled = []
+        self._lock = threading.Lock()
+
+    def __call__(self, method, url, data):
+
+        if url == pushover.NOTIFY_URL:
+            if data['user'].startswith('_'):
+                return pushover_handler(method, url, data)
+
+            with self._lock:
+                receipt = 'r{0}'.format(len(self.receipts))
+                self.receipts[receipt] = {
+                    'acknowledged': 0, 'expired': 0, 'expires_at': 0,
+                    'last_delivered_at': 0}
+            return FakeResponse(json.dumps({'status': 1,
+                                            'receipt': receipt}))
+
+        receipt = url.split('/')[5].split('.')[0]
+        if receipt not in self.receipts:
+            return FakeResponse(json.dumps({
+                'status': 0, 'receipt': 'not found',
+                'errors': ['receipt not found; may be invalid or expired']}),
+                404)
+
+        if url.endswith('/cancel.json'):
+            self.cancelled.append(receipt)
+            return FakeResponse(json.dumps({'status': 1}))
+
+        status = dict(self.receipts[receipt], status=1)
+        return FakeResponse(json.dumps(status))
+
+
+class ReceiptTrackerTest(unittest.TestCase):
+    """Test the ReceiptTracker class.
+
+    """
+
+    def setUp(self):
+
+        self.server = FakeReceipts()
+        self.clock = FakeClock()
+        self.client = pushover.Client('token', workers=4)
+        self.client._browser = FakeSession(self.server)
+        self.finished = []
+        self.tracker = receipts.ReceiptTracker(
+            self.client,
+            on_acknowledge=lambda r, s: self.finished.append(('ack', r)),
+            on_expire=lambda r, s: self.finished.append(('expired', r)),
+            clock=self.clock.time, sleep=self.clock.sleep)
+
+    def test_notify(self):
+        """Test tracking the receipt of every user and chunk.
+
+        """
+
+        self.assertEqual(self.tracker.notify('desc', 'event'), [])
+
+        self.client.add_key('user1')
+        self.client.add_key('user2')
+
+        tracked = self.tracker.notify('a' * 600, 'event',
+                                      kwargs={'retry': 30, 'expire': 60})
+
+        self.assertEqual(sorted(tracked), ['r0', 'r1', 'r2', 'r3'])
+        self.assertEqual(self.tracker.pending(), sorted(tracked))
+        for method, url, data in self.client._browser.requests:
+            self.assertEqual(data['priority'], '2')
+
+        self.client.del_key('user1')
+        self.client.del_key('user2')
+        self.client.add_key('_bad')
+        self.assertRaises(exceptions.ApiKeyError, self.tracker.notify,
+                          'desc', 'event', kwargs={'retry': 30,
+                                                   'expire': 60})
+
+    def test_callbacks(self):
+        """Test calling back once each receipt is acknowledged or
+        expires.
+
+        """
+
+        self.server.receipts['a'] = {'acknowledged': 0, 'expired': 0,
+                                     'expires_at': 0,
+                                     'last_delivered_at': 0}
+        self.server.receipts['b'] = dict(self.server.receipts['a'])
+        self.tracker.track('a')
+        self.tracker.track('b')
+        self.tracker.track('unknown')
+
+        self.assertEqual(self.tracker.poll(), 0)
+        self.clock.sleep(5)
+        self.assertEqual(self.tracker.poll(), 3)
+        self.assertEqual(self.tracker.pending(), ['a', 'b'])
+        self.assertEqual(self.finished, [])
+
+        self.server.receipts['a']['acknowledged'] = 1
+        self.server.receipts['b']['expired'] = 1
+        self.assertTrue(self.tracker.wait())
+
+        self.assertEqual(sorted(self.finished),
+                         [('ack', 'a'), ('expired', 'b')])
+        self.assertEqual(self.tracker.pending(), [])
+
+    def test_adaptive_interval(self):
+        """Test backing off while nothing changes, and polling sooner
+        after a resend or at expiry.
+
+        """
+
+        status = {'acknowledged': 0, 'expired': 0, 'expires_at': 0,
+                  'last_delivered_at': 0}
+        self.server.receipts['a'] = status
+        self.tracker.track('a')
+
+        def gaps():
+            polled = []
+            start = self.clock.now
+            while len(polled) < 5:
+                self.clock.sleep(self.tracker._due())
+                self.tracker.poll()
+                polled.append(self.clock.now - start)
+                start = self.clock.now
+            return polled
+
+        self.assertEqual(gaps(), [5, 5, 10, 20, 40])
+
+        status['last_delivered_at'] = 1
+        self.assertEqual(self.tracker._due(), 60)
+        self.clock.sleep(60)
+        self.tracker.poll()
+        self.assertEqual(self.tracker._due(), 5)
+
+        status['expires_at'] = self.clock.now + 12
+        self.assertEqual(gaps(), [5, 7, 5, 5, 5])
+
+        self.assertFalse(self.tracker.wait(timeout=30))
+
+    def test_cancel(self):
+        """Test cancelling a receipt.
+
+        """
+
+        self.server.receipts['a'] = {}
+        self.tracker.track('a')
+        self.tracker.cancel('a')
+
+        self.assertEqual(self.server.cancelled, ['a'])
+        self.assertEqual(self.tracker.pending(), [])
+        self.assertRaises(exceptions.FormatError, self.tracker.cancel, 'b')
+
+
 if __name__ == '__main__':
     pass